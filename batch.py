@@ -0,0 +1,151 @@
+"""
+Scrape the metro tweets of several cities and date ranges in one browser session:
+one login and one pool of tabs work through the intervals of every city, while each
+city and range keeps its own output file, as written by test.py.
+
+python batch.py --since 2024-01-01 --until 2024-12-31
+python batch.py --cities seoul,hongkong --ranges 2023-01-01:2023-07-01,2023-07-01:2024-01-01
+
+With --workers, one browser process per account scrapes shards of every date range
+(see supervisor.py). The file holds a JSON list of per-process Scweet settings:
+[{"env_path": "a.env", "cookies_path": "cookies_a"}, {"env_path": "b.env", "proxy": {"host": "...", "port": "..."}}]
+
+With --queue, the intervals of every city and range are published to a shared job
+queue instead, for `python jobqueue.py work` processes on any machine (see jobqueue.py).
+"""
+
+import argparse
+import json
+import sys
+
+from jobqueue import JobQueue, publish_scrape
+from scweet import Scweet
+from supervisor import ScrapeSupervisor
+
+
+def load_cities_config(config_file='cities_config.json'):
+    """Load cities configuration file"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Error: Configuration file {config_file} not found")
+        sys.exit(1)
+    except json.JSONDecodeError:
+        print(f"Error: Configuration file {config_file} format is incorrect")
+        sys.exit(1)
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Twitter Metro Data Batch Scraper')
+    parser.add_argument('--cities', type=str, default="",
+                        help='Comma-separated city configuration keys (default: every city in the configuration)')
+    parser.add_argument('--since', type=str, default="", help='Start date (YYYY-MM-DD format)')
+    parser.add_argument('--until', type=str, default="", help='End date (YYYY-MM-DD format)')
+    parser.add_argument('--ranges', type=str, default="",
+                        help='Comma-separated since:until date ranges, scraped for every city (overrides --since/--until)')
+    parser.add_argument('--limit', type=int, default=90000, help='Tweet limit of each city and date range')
+    parser.add_argument('--config', type=str, default='cities_config.json', help='Cities configuration file')
+    parser.add_argument('--n_splits', type=int, default=42, help='Number of intervals of each date range')
+    parser.add_argument('--concurrency', type=int, default=2, help='Browser tabs shared by all cities')
+    parser.add_argument('--env_path', type=str, default='.env', help='.env file holding account credentials')
+    parser.add_argument('--cookies_path', type=str, default='cookies', help='Cookies directory')
+    parser.add_argument('--output_format', type=str, default='csv', help='csv, parquet or sqlite')
+    parser.add_argument('--workers', type=str, default="",
+                        help='JSON file listing the account settings of each browser process')
+    parser.add_argument('--shards_per_worker', type=int, default=1,
+                        help='Shards of each date range per browser process (with --workers)')
+    parser.add_argument('--queue', type=str, default="",
+                        help='Job queue database to publish the intervals to instead of scraping them')
+    return parser.parse_args()
+
+
+def parse_ranges(args):
+    """The (since, until) date ranges to scrape for every city"""
+    if args.ranges:
+        ranges = []
+        for date_range in args.ranges.split(','):
+            since, _, until = date_range.partition(':')
+            if not since:
+                print(f"Error: Date range '{date_range}' has no start date")
+                sys.exit(1)
+            ranges.append((since, until or None))
+        return ranges
+    if not args.since:
+        print("Error: --since or --ranges is required")
+        sys.exit(1)
+    return [(args.since, args.until or None)]
+
+
+def build_jobs(city_keys, cities_config, ranges, limit, output_format):
+    """One ascrape job per city and date range, with the output layout of test.py"""
+    jobs = []
+    for city_key in city_keys:
+        if city_key not in cities_config:
+            print(f"Error: City configuration '{city_key}' does not exist")
+            print(f"Available city configurations: {', '.join(cities_config.keys())}")
+            sys.exit(1)
+        city_config = cities_config[city_key]
+        for since, until in ranges:
+            if until:
+                custom_filename = f'{city_key}_metro_tweets_{since}_to_{until}.csv'
+            else:
+                custom_filename = f'{city_key}_metro_tweets_{since}_onwards.csv'
+            jobs.append(dict(
+                since=since,
+                until=until,
+                words=city_config['metro_keywords'],
+                lang=city_config.get('language', None),
+                geocode=city_config.get('geocode'),
+                limit=limit,
+                display_type="Recent",
+                resume=True,
+                save_dir=f'{city_key}_metro_data',
+                custom_csv_name=custom_filename,
+                output_format=output_format,
+                # results are read back from the output files
+                keep_results=False,
+            ))
+    return jobs
+
+
+def main():
+    args = parse_arguments()
+    cities_config = load_cities_config(args.config)
+    city_keys = [key.strip() for key in args.cities.split(',') if key.strip()] or list(cities_config)
+    jobs = build_jobs(city_keys, cities_config, parse_ranges(args), args.limit, args.output_format)
+    print(f"{len(jobs)} jobs: {', '.join(job['save_dir'] + '/' + job['custom_csv_name'] for job in jobs)}")
+
+    if args.queue:
+        queue = JobQueue(args.queue)
+        try:
+            for job in jobs:
+                publish_scrape(queue, n_splits=args.n_splits, **job)
+            print(f"Queue {args.queue}: {queue.counts()}")
+        finally:
+            queue.close()
+        return
+
+    scweet_kwargs = dict(proxy=None,
+                         cookies=None,
+                         cookies_path=args.cookies_path,
+                         user_agent=None,
+                         disable_images=True,
+                         env_path=args.env_path,
+                         n_splits=args.n_splits,
+                         concurrency=args.concurrency,
+                         headless=False,
+                         scroll_ratio=100)
+    if args.workers:
+        with open(args.workers, 'r', encoding='utf-8') as f:
+            workers = json.load(f)
+        print(f"Scraping with {len(workers)} browser processes")
+        ScrapeSupervisor(workers, shards_per_worker=args.shards_per_worker, **scweet_kwargs).batch_scrape(jobs)
+    else:
+        Scweet(**scweet_kwargs).batch_scrape(jobs)
+    print("\nScraping completed!")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmarks for the scraping hot paths.
+
+python benchmark.py scroll --url "https://x.com/search?q=seoul%20metro&f=live" --scrolls 20 --record snapshots
+python benchmark.py parse --html_dir snapshots
+python benchmark.py backends --html_dir snapshots --profile_dir profiles
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import statistics
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from parsers import PARSER_BACKENDS, get_parser_backend, parse_tweets
+from scweet import Scweet
+from utils import check_element_if_exists_by_text, get_page_state
+
+
+async def text_lookup_probe(tab):
+    return await check_element_if_exists_by_text(tab, "Something went wrong. Try reloading.")
+
+
+async def bench_scroll(scweet, url, scrolls, record_dir=None):
+    """Time one scroll iteration with the old text lookup and with the page-state probe."""
+    probes = [("text lookup", text_lookup_probe), ("page-state probe", get_page_state)]
+    await scweet.init_nodriver()
+    _, logged_in, reason, _ = await scweet.login()
+    if not logged_in:
+        print(f"Couldn't login due to {reason}")
+        return
+    for name, probe in probes:
+        tab = await scweet.driver.get(url, new_tab=True)
+        await tab.sleep(2)
+        timings = []
+        for _ in range(scrolls):
+            start = time.perf_counter()
+            await tab.scroll_down(scweet.scroll_ratio)
+            await tab.sleep(0.5)
+            html_el = await tab.get_content()
+            await probe(tab)
+            timings.append(time.perf_counter() - start)
+            if record_dir:
+                with open(os.path.join(record_dir, f"{len(timings):04d}.html"), "w", encoding="utf-8") as f:
+                    f.write(html_el)
+        await tab.close()
+        print(f"{name:>20}: {statistics.mean(timings):.3f}s mean, "
+              f"{statistics.median(timings):.3f}s median per scroll over {scrolls} scrolls")
+    await scweet.close()
+
+
+async def full_parse(scweet, html_content, all_posts_data):
+    """Extraction as it was before the status-id prefilter: every article, every scroll."""
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for post_soup in soup.select('article[data-testid=tweet]'):
+        data = await scweet.get_data(post_soup)
+        if data:
+            all_posts_data.setdefault(data['tweet_url'].split("/")[-1], data)
+    return all_posts_data
+
+
+async def incremental_parse(scweet, html_content, all_posts_data):
+    return await scweet.aget_data(html_content, "bench", all_posts_data)
+
+
+async def bench_parse(scweet, html_dir, rounds):
+    """Replay recorded scroll snapshots in order through each extraction strategy."""
+    snapshots = [html_el for _, html_el in load_snapshots(html_dir)]
+    if not snapshots:
+        print(f"No .html snapshots in {html_dir}")
+        return
+    size_mb = sum(len(html_el) for html_el in snapshots) / (1024 * 1024)
+    results = {}
+    for name, parse in (("full parse", full_parse), ("incremental", incremental_parse)):
+        timings = []
+        for _ in range(rounds):
+            all_posts_data = {}
+            start = time.perf_counter()
+            for html_el in snapshots:
+                await parse(scweet, html_el, all_posts_data)
+            timings.append(time.perf_counter() - start)
+        results[name] = all_posts_data
+        best = min(timings)
+        print(f"{name:>20}: {len(snapshots) / best:.1f} snapshots/s, {size_mb / best:.1f} MB/s, "
+              f"{len(all_posts_data)} tweets")
+    if results["full parse"] != results["incremental"]:
+        print("WARNING: strategies extracted different tweets")
+
+
+def load_snapshots(html_dir):
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(html_dir, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            snapshots.append((os.path.basename(path), f.read()))
+    return snapshots
+
+
+def bench_backends(html_dir, profile_dir, rounds):
+    """
+    Check that every parser backend returns the same tweets and profiles as bs4 on
+    the recorded fixtures, then time each of them. Returns False on any mismatch.
+    """
+    tweet_pages = load_snapshots(html_dir)
+    profile_pages = load_snapshots(profile_dir) if profile_dir else []
+    backends = []
+    for name in PARSER_BACKENDS:
+        try:
+            backends.append(get_parser_backend(name))
+        except ImportError as e:
+            print(f"Skipping {name}: {e}")
+
+    reference = get_parser_backend("bs4")
+    identical = True
+    for backend in backends:
+        if backend is reference:
+            continue
+        for fname, html_el in tweet_pages:
+            if parse_tweets(html_el, (), backend.name) != parse_tweets(html_el, (), reference.name):
+                print(f"MISMATCH {backend.name} tweets: {fname}")
+                identical = False
+        for fname, html_el in profile_pages:
+            if backend.parse_profile(html_el) != reference.parse_profile(html_el):
+                print(f"MISMATCH {backend.name} profile: {fname}")
+                identical = False
+    print(f"parity on {len(tweet_pages)} timeline and {len(profile_pages)} profile fixtures: "
+          f"{'identical' if identical else 'DIFFERENT'}")
+
+    size_mb = sum(len(html_el) for _, html_el in tweet_pages) / (1024 * 1024)
+    for backend in backends:
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            n_tweets = sum(len(parse_tweets(html_el, (), backend.name)) for _, html_el in tweet_pages)
+            for _, html_el in profile_pages:
+                backend.parse_profile(html_el)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(f"{backend.name:>20}: {size_mb / best:.1f} MB/s, {n_tweets / best:.0f} tweets/s, "
+              f"{best:.3f}s per round")
+    return identical
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Scweet benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scroll = subparsers.add_parser('scroll', help='Per-scroll timing on a live search page')
+    scroll.add_argument('--url', type=str, required=True, help='Search URL to scroll')
+    scroll.add_argument('--scrolls', type=int, default=20, help='Scrolls per probe')
+    scroll.add_argument('--env_path', type=str, default='.env', help='.env file holding account credentials')
+    scroll.add_argument('--cookies_path', type=str, default='cookies', help='Cookies directory')
+    scroll.add_argument('--scroll_ratio', type=int, default=100, help='Scrolling ratio')
+    scroll.add_argument('--record', type=str, default=None, help='Directory to save page snapshots into')
+
+    parse = subparsers.add_parser('parse', help='Parse throughput on recorded page snapshots')
+    parse.add_argument('--html_dir', type=str, required=True, help='Directory of recorded .html snapshots')
+    parse.add_argument('--rounds', type=int, default=3, help='Repetitions, the best one is reported')
+
+    backends = subparsers.add_parser('backends', help='Parity and speed of the parser backends')
+    backends.add_argument('--html_dir', type=str, required=True, help='Directory of recorded timeline .html snapshots')
+    backends.add_argument('--profile_dir', type=str, default=None, help='Directory of recorded profile .html pages')
+    backends.add_argument('--rounds', type=int, default=3, help='Repetitions, the best one is reported')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.command == 'scroll':
+        scweet = Scweet(cookies_path=args.cookies_path, env_path=args.env_path,
+                        headless=False, scroll_ratio=args.scroll_ratio)
+        if args.record and not os.path.exists(args.record):
+            os.makedirs(args.record)
+        asyncio.run(bench_scroll(scweet, args.url, args.scrolls, args.record))
+    elif args.command == 'parse':
+        scweet = Scweet(headless=False)
+        asyncio.run(bench_parse(scweet, args.html_dir, args.rounds))
+    elif args.command == 'backends':
+        if not bench_backends(args.html_dir, args.profile_dir, args.rounds):
+            sys.exit(1)
@@ -0,0 +1,210 @@
+"""
+Persistent set of the tweet ids already written to one output, checked before each
+row is emitted so resumed runs and overlapping intervals don't duplicate tweets.
+"""
+
+import array
+import bisect
+import heapq
+import logging
+import mmap
+import os
+
+MASK64 = (1 << 64) - 1
+BLOOM_HASHES = 7
+# ~1% false positives at full capacity
+BLOOM_BITS_PER_ID = 10
+BLOOM_MIN_CAPACITY = 1 << 16
+
+
+def _mix64(x):
+    """splitmix64 finalizer: spreads the sequential bits of snowflake ids."""
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & MASK64
+    return x ^ (x >> 31)
+
+
+def _to_int(tweet_id):
+    try:
+        return int(tweet_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class BloomFilter:
+    """Bit array with double hashing, stored as <8-byte size of the covered id array><bits>."""
+
+    def __init__(self, capacity, bits=None, count=0):
+        self.capacity = capacity
+        self.count = count
+        self.bits = bits if bits is not None else bytearray(max(capacity * BLOOM_BITS_PER_ID // 8, 8))
+        self.n_bits = len(self.bits) * 8
+
+    def _positions(self, x):
+        h1 = _mix64(x)
+        h2 = _mix64(h1 ^ x) | 1
+        return ((h1 + i * h2) % self.n_bits for i in range(BLOOM_HASHES))
+
+    def add(self, x):
+        for pos in self._positions(x):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, x):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(x))
+
+    def save(self, path, covered):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(covered.to_bytes(8, "little"))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Returns the filter and the size of the id array it was saved for."""
+        with open(path, "rb") as f:
+            covered = int.from_bytes(f.read(8), "little")
+            bits = bytearray(f.read())
+        return cls(len(bits) * 8 // BLOOM_BITS_PER_ID, bits, covered), covered
+
+
+class TweetIdIndex:
+    """
+    Ids live in three tiers. <path> is a sorted int64 array searched in place
+    through mmap and bisect. <path>.log appends the ids committed since the array
+    was last compacted. Ids added during this run stay pending until `commit`,
+    which the owner calls once their rows are durable in the output, so a crash
+    never hides a tweet that wasn't written. A Bloom filter (<path>.bloom) in front
+    answers most lookups of unseen ids without touching the array.
+    """
+
+    def __init__(self, path, reset=False, compact_ratio=0.1):
+        self.path = path
+        self.log_path = path + ".log"
+        self.bloom_path = path + ".bloom"
+        self.compact_ratio = compact_ratio
+        if reset:
+            self.remove()
+        self._file = None
+        self._mmap = None
+        self._ids = memoryview(b"").cast("q")
+        self._open_ids()
+
+        self._logged = set()
+        if os.path.exists(self.log_path):
+            logged = array.array("q")
+            with open(self.log_path, "rb") as f:
+                data = f.read()
+            # ignore a torn last id
+            logged.frombytes(data[:len(data) - len(data) % logged.itemsize])
+            self._logged = set(logged)
+        self._pending = set()
+
+        self._bloom = None
+        if os.path.exists(self.bloom_path):
+            bloom, covered = BloomFilter.load(self.bloom_path)
+            # the saved filter only covers the sorted array it was built with
+            if covered == len(self._ids) and bloom.capacity >= len(self):
+                self._bloom = bloom
+        if self._bloom is None:
+            self._rebuild_bloom()
+        else:
+            for x in self._logged:
+                self._bloom.add(x)
+        logging.info(f"Tweet id index {path}: {len(self)} ids")
+
+    def __len__(self):
+        return len(self._ids) + len(self._logged) + len(self._pending)
+
+    def __contains__(self, tweet_id):
+        x = _to_int(tweet_id)
+        if x is None:
+            return False
+        if x in self._pending or x in self._logged:
+            return True
+        if x not in self._bloom:
+            return False
+        i = bisect.bisect_left(self._ids, x)
+        return i < len(self._ids) and self._ids[i] == x
+
+    def add(self, tweet_id):
+        """Mark an id as emitted; it is persisted at the next `commit`."""
+        x = _to_int(tweet_id)
+        if x is None or x in self:
+            return
+        self._pending.add(x)
+        if self._bloom.count >= self._bloom.capacity:
+            self._rebuild_bloom()
+        else:
+            self._bloom.add(x)
+
+    def commit(self):
+        """Persist the pending ids, once their rows are durable in the output."""
+        if not self._pending:
+            return
+        with open(self.log_path, "ab") as f:
+            array.array("q", self._pending).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._logged |= self._pending
+        self._pending = set()
+
+    def compact(self):
+        """Merge the logged ids into the sorted array and save a matching Bloom filter."""
+        tmp_path = self.path + ".tmp"
+        chunk = array.array("q")
+        last = None
+        with open(tmp_path, "wb") as f:
+            for x in heapq.merge(self._ids, sorted(self._logged)):
+                if x == last:
+                    continue
+                chunk.append(x)
+                last = x
+                if len(chunk) >= 65536:
+                    chunk.tofile(f)
+                    chunk = array.array("q")
+            chunk.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        self._close_ids()
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._logged = set()
+        self._open_ids()
+        # the live filter already holds every id, it only needs saving
+        self._bloom.save(self.bloom_path, len(self._ids))
+
+    def close(self):
+        """Compact when the log has grown past `compact_ratio` of the sorted array."""
+        if self._logged and len(self._logged) >= self.compact_ratio * len(self._ids):
+            self.compact()
+        self._close_ids()
+
+    def remove(self):
+        for path in (self.path, self.log_path, self.bloom_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _open_ids(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._ids = memoryview(self._mmap).cast("q")
+
+    def _close_ids(self):
+        self._ids.release()
+        self._ids = memoryview(b"").cast("q")
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    def _rebuild_bloom(self):
+        """Size the filter for twice the current ids, which bounds how often this runs."""
+        bloom = BloomFilter(max(2 * len(self), BLOOM_MIN_CAPACITY))
+        for ids in (self._ids, self._logged, self._pending):
+            for x in ids:
+                bloom.add(x)
+        self._bloom = bloom
@@ -0,0 +1,460 @@
+"""
+Distributed scraping through a shared queue of (search, interval) jobs. Publishers
+add jobs, workers on any machine claim them under a lease they keep alive with
+heartbeats, and report the tweets they found back to the queue, where they are
+aggregated into one output per search. A job whose worker dies is claimed again
+once its lease expires.
+
+python jobqueue.py work --queue queue.db --env_path a.env --cookies_path cookies_a
+python jobqueue.py status --queue queue.db
+python jobqueue.py aggregate --queue queue.db
+
+batch.py --queue queue.db publishes the city jobs instead of scraping them.
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+from planner import split_intervals
+from sinks import output_path
+from supervisor import write_output
+
+JOBQUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    grp TEXT,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+CREATE TABLE IF NOT EXISTS tweets (
+    grp TEXT,
+    tweet_id TEXT,
+    data TEXT,
+    PRIMARY KEY (grp, tweet_id)
+);
+"""
+
+
+class Lease:
+    """A claimed job. `attempt` fences the lease: once the job is claimed again, the old lease is rejected."""
+
+    def __init__(self, job_id, key, payload, attempt):
+        self.job_id = job_id
+        self.key = key
+        self.payload = payload
+        self.attempt = attempt
+
+
+class JobQueue:
+    """
+    Reference backend: a SQLite database on storage every worker can reach. Jobs
+    go pending -> leased -> done, or back to pending when their worker reports a
+    failure or stops renewing its lease, until `max_attempts` claims have been used
+    and the job is marked failed. Every state change runs in one IMMEDIATE
+    transaction, so concurrent workers never claim the same job. The tweets of a
+    job are stored in the same transaction that marks it done.
+
+    The database uses the rollback journal (journal_mode=DELETE): WAL needs shared
+    memory between the processes, which a network filesystem can't provide. The
+    transactions are still only as safe as the file locks of the storage. On a
+    single host any local disk works. Across machines, the network filesystem must
+    implement POSIX byte-range locks correctly (e.g. NFSv4 with locking enabled).
+    NFS mounted with nolock, or SMB mounts without byte-range locks, can let two
+    workers claim the same job or corrupt the database. If that can't be ruled out,
+    keep the queue on one host. Writers wait up to 60 s for the lock, and a long
+    read such as `aggregate` blocks them meanwhile, so aggregate once the workers
+    are done.
+    """
+
+    def __init__(self, path, lease_seconds=600, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # every write transaction takes the database lock up front
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level="IMMEDIATE")
+        # not WAL: its shared-memory index doesn't work over network filesystems
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        with self._conn:
+            self._conn.executescript(JOBQUEUE_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def publish(self, jobs):
+        """Add (key, group, payload) jobs; keys already in the queue are left as they are. Returns the number added."""
+        now = time.time()
+        with self._conn as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (key, grp, payload, updated_at) VALUES (?, ?, ?, ?)",
+                [(key, group, json.dumps(payload), now) for key, group, payload in jobs])
+            return conn.total_changes - before
+
+    def claim(self, worker, n=1):
+        """Lease up to n pending jobs, or jobs whose lease expired, to `worker`."""
+        now = time.time()
+        with self._conn as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired', updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            rows = conn.execute(
+                "SELECT id, key, payload, attempts FROM jobs "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT ?", (now, n)).fetchall()
+            leases = []
+            for job_id, key, payload, attempts in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker = ?, attempts = ?, lease_expires = ?, updated_at = ? "
+                    "WHERE id = ?", (worker, attempts + 1, now + self.lease_seconds, now, job_id))
+                leases.append(Lease(job_id, key, json.loads(payload), attempts + 1))
+        return leases
+
+    def heartbeat(self, leases):
+        """Renew the leases. Returns the ones that were lost to another worker."""
+        now = time.time()
+        lost = []
+        with self._conn as conn:
+            for lease in leases:
+                cursor = conn.execute(
+                    "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                    "WHERE id = ? AND status = 'leased' AND attempts = ?",
+                    (now + self.lease_seconds, now, lease.job_id, lease.attempt))
+                if not cursor.rowcount:
+                    lost.append(lease)
+        return lost
+
+    def complete(self, lease, tweets, result):
+        """Store the job's (tweet_id, tweet_data) and mark it done. False if the lease was lost."""
+        now = time.time()
+        with self._conn as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND attempts = ?",
+                (json.dumps(result), now, lease.job_id, lease.attempt))
+            if not cursor.rowcount:
+                return False
+            # a later scrape of the same tweet refreshes its counts
+            conn.executemany(
+                "INSERT OR REPLACE INTO tweets (grp, tweet_id, data) VALUES (?, ?, ?)",
+                [(lease.payload["group"], tweet_id, json.dumps(tweet_data)) for tweet_id, tweet_data in tweets])
+        return True
+
+    def fail(self, lease, error):
+        """Give the job back for another attempt, or mark it failed once it used max_attempts."""
+        with self._conn as conn:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'leased' AND attempts = ?",
+                (self.max_attempts, str(error), time.time(), lease.job_id, lease.attempt))
+
+    def retry_failed(self):
+        """Queue the failed jobs again with fresh attempts. Returns how many."""
+        with self._conn as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'",
+                (time.time(),))
+            return cursor.rowcount
+
+    def counts(self, group=None):
+        """{status: number of jobs}, for one group or the whole queue."""
+        query = "SELECT status, COUNT(*) FROM jobs"
+        params = ()
+        if group is not None:
+            query += " WHERE grp = ?"
+            params = (group,)
+        return dict(self._conn.execute(query + " GROUP BY status", params).fetchall())
+
+    def groups(self):
+        """{group: output format} of every published group."""
+        groups = {}
+        for group, payload in self._conn.execute("SELECT grp, MIN(payload) FROM jobs GROUP BY grp"):
+            groups[group] = json.loads(payload).get("output_format", "csv")
+        return groups
+
+    def iter_tweets(self, group):
+        """Every (tweet_id, tweet_data) reported for the group, in id order."""
+        cursor = self._conn.execute(
+            "SELECT tweet_id, data FROM tweets WHERE grp = ? ORDER BY CAST(tweet_id AS INTEGER)", (group,))
+        for tweet_id, data in cursor:
+            yield tweet_id, json.loads(data)
+
+    def aggregate(self, group, path=None, output_format=None):
+        """Write the group's tweets into its output (by default the path ascrape would have used)."""
+        path = path or group
+        output_format = output_format or self.groups().get(group, "csv")
+        counts = self.counts(group)
+        if counts.keys() - {"done"}:
+            logging.info(f"Aggregating {group} before all its jobs are done: {counts}")
+        count = write_output(self.iter_tweets(group), path, output_format)
+        logging.info(f"Aggregated {count} rows into {path}")
+        return count
+
+
+def publish_scrape(queue, n_splits=5, **scrape_kwargs):
+    """
+    Publish one ascrape call as one job per interval of [since, until], grouped under
+    the output path ascrape would write. Limits apply per interval. Returns the group.
+    """
+    job = dict(scrape_kwargs)
+    # results are reported to the queue, not resumed from local files
+    for key in ("resume", "keep_results", "save_dir"):
+        job.pop(key, None)
+    until = job.get("until") or date.today().strftime("%Y-%m-%d")
+    words = job.get("words")
+    if words and isinstance(words, str):
+        words = job["words"] = words.split("//")
+    output_format = job.get("output_format", "csv")
+    group = output_path(scrape_kwargs.get("save_dir", "outputs"), job["since"], until, words=words,
+                        from_account=job.get("from_account"), to_account=job.get("to_account"),
+                        mention_account=job.get("mention_account"), hashtag=job.get("hashtag"),
+                        custom_csv_name=job.get("custom_csv_name"), output_format=output_format)
+    intervals = split_intervals(datetime.strptime(job["since"], "%Y-%m-%d"), datetime.strptime(until, "%Y-%m-%d"),
+                                n_splits)
+    added = queue.publish(
+        (f"{group}|{since.isoformat()}|{interval_until.isoformat()}", group,
+         {"group": group, "output_format": output_format, "kwargs": job,
+          "since": since.isoformat(), "until": interval_until.isoformat()})
+        for since, interval_until in intervals)
+    logging.info(f"Published {added} of {len(intervals)} intervals of {group}")
+    return group
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Renews leases from a thread with its own connection, so a busy event loop can't
+    let them expire. Renewal stops once `last_activity()` (a time.monotonic value) is
+    older than `stall_seconds`: a hung browser must not keep its jobs leased forever.
+    """
+
+    def __init__(self, queue_path, leases, lease_seconds, last_activity, stall_seconds):
+        super().__init__(daemon=True)
+        self.queue_path = queue_path
+        self.leases = leases
+        self.lease_seconds = lease_seconds
+        self.last_activity = last_activity
+        self.stall_seconds = stall_seconds
+        self.lost = set()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        queue = JobQueue(self.queue_path, lease_seconds=self.lease_seconds)
+        try:
+            while not self._stop_event.wait(self.lease_seconds / 3):
+                if time.monotonic() - self.last_activity() > self.stall_seconds:
+                    logging.info(f"No scraping progress for {self.stall_seconds} s, letting the leases expire")
+                    continue
+                try:
+                    lost = queue.heartbeat([lease for lease in self.leases if lease.key not in self.lost])
+                except sqlite3.Error as e:
+                    logging.info(f"Heartbeat failed: {e}")
+                    continue
+                for lease in lost:
+                    logging.info(f"Lost the lease of {lease.key}")
+                    self.lost.add(lease.key)
+        finally:
+            queue.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+async def _await_batch(batch, scweet, stall_seconds):
+    """
+    Await a run_scrape_jobs task, cancelling it once no tab scrolled for `stall_seconds`:
+    a browser that crashed mid-command leaves that command waiting forever.
+    """
+    while not batch.done():
+        await asyncio.wait({batch}, timeout=min(stall_seconds / 4, 30))
+        if not batch.done() and time.monotonic() - scweet.last_activity > stall_seconds:
+            batch.cancel()
+            await asyncio.gather(batch, return_exceptions=True)
+            raise TimeoutError(f"no scraping progress for {stall_seconds} s")
+    return batch.result()
+
+
+async def _close_scweet(scweet):
+    try:
+        # a crashed browser may not answer the close commands either
+        await asyncio.wait_for(scweet.close(), timeout=60)
+    except Exception as e:
+        logging.info(f"Couldn't close the browser: {e}")
+
+
+def run_worker(queue_path, worker=None, work_dir=".queue_work", poll_interval=30, exit_when_idle=True,
+               lease_seconds=600, max_attempts=3, stall_seconds=None, **scweet_kwargs):
+    """
+    Claim jobs until the queue is drained: up to `concurrency` at a time, scraped under
+    heartbeated leases by one browser session kept for the worker's lifetime
+    (Scweet.run_scrape_jobs). A batch in which no tab scrolled for `stall_seconds`
+    (default: lease_seconds) is cancelled and its leases are no longer renewed. A job
+    is complete once its interval is covered by done intervals; its tweets are then
+    reported to the queue, otherwise it is given back for another attempt. After a
+    failed batch the worker starts over with a new Scweet. Scratch outputs go to
+    `work_dir`. Returns the number of jobs completed.
+    """
+    return asyncio.run(arun_worker(queue_path, worker=worker, work_dir=work_dir, poll_interval=poll_interval,
+                                   exit_when_idle=exit_when_idle, lease_seconds=lease_seconds,
+                                   max_attempts=max_attempts, stall_seconds=stall_seconds, **scweet_kwargs))
+
+
+async def arun_worker(queue_path, worker=None, work_dir=".queue_work", poll_interval=30, exit_when_idle=True,
+                      lease_seconds=600, max_attempts=3, stall_seconds=None, **scweet_kwargs):
+    """Coroutine of run_worker: the browser belongs to the event loop it was started in."""
+    # imported here so publishers and aggregators don't need the browser dependencies loaded
+    from scweet import Scweet
+
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    stall_seconds = stall_seconds or lease_seconds
+    queue = JobQueue(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    scweet = Scweet(**scweet_kwargs)
+    completed = 0
+    try:
+        while True:
+            if scweet.suspended:
+                logging.info(f"[{worker}] Account suspended, stopping the worker")
+                return completed
+            leases = queue.claim(worker, n=scweet_kwargs.get("concurrency", 5))
+            if not leases:
+                counts = queue.counts()
+                if exit_when_idle and not counts.get("leased"):
+                    logging.info(f"Queue drained: {counts}")
+                    return completed
+                await asyncio.sleep(poll_interval)
+                continue
+            logging.info(f"[{worker}] Claimed {', '.join(lease.key for lease in leases)}")
+
+            # logging in counts as progress until the first scroll
+            scweet.last_activity = time.monotonic()
+            heartbeat = _Heartbeat(queue_path, leases, lease_seconds, lambda: scweet.last_activity, stall_seconds)
+            heartbeat.start()
+            jobs = []
+            try:
+                for lease in leases:
+                    since = datetime.fromisoformat(lease.payload["since"])
+                    until = datetime.fromisoformat(lease.payload["until"])
+                    name = f"{worker}.{lease.job_id}".replace(":", "_").replace(os.sep, "_")
+                    jobs.append(scweet.prepare_scrape(
+                        **dict(lease.payload["kwargs"], since=since.strftime("%Y-%m-%d"),
+                               until=until.strftime("%Y-%m-%d"), save_dir=work_dir,
+                               custom_csv_name=f"{name}.csv", resume=False, keep_results=True),
+                        intervals=[(since, until)]))
+                batch = asyncio.create_task(scweet.run_scrape_jobs(jobs, stay_logged_in=True))
+                results = await _await_batch(batch, scweet, stall_seconds)
+            except Exception as e:
+                logging.info(f"[{worker}] Scraping failed: {e}")
+                results = [{} for _ in leases]
+                # the next jobs start from a fresh browser, display and login
+                await _close_scweet(scweet)
+                scweet = Scweet(**scweet_kwargs)
+            finally:
+                heartbeat.stop()
+
+            for i, (lease, tweets) in enumerate(zip(leases, results)):
+                job = jobs[i] if i < len(jobs) else None
+                since = datetime.fromisoformat(lease.payload["since"])
+                until = datetime.fromisoformat(lease.payload["until"])
+                if lease.key in heartbeat.lost:
+                    continue
+                if job is None or not job.manifest.covers(since, until):
+                    reasons = [] if job is None else [entry.get("reason") for entry in job.manifest.intervals.values()]
+                    queue.fail(lease, f"incomplete: {reasons}")
+                    continue
+                result = {"worker": worker, "tweets": len(tweets),
+                          "intervals": len(job.manifest.intervals), "splits": job.planner.splits}
+                if queue.complete(lease, tweets.items(), result):
+                    completed += 1
+                else:
+                    logging.info(f"[{worker}] Lease of {lease.key} was lost, its result is dropped")
+            # the queue holds the results now
+            for job in jobs:
+                for path in glob.glob(glob.escape(job.path) + "*"):
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+    finally:
+        # also stops the display and parse workers of a Scweet that never started its browser
+        await _close_scweet(scweet)
+        queue.close()
+
+
+def parse_arguments():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Distributed scraping job queue')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    work = subparsers.add_parser('work', help='Claim and scrape jobs until the queue is drained')
+    work.add_argument('--queue', type=str, required=True, help='Queue database')
+    work.add_argument('--env_path', type=str, default='.env', help='.env file holding account credentials')
+    work.add_argument('--cookies_path', type=str, default='cookies', help='Cookies directory')
+    work.add_argument('--proxy', type=str, default=None, help='Proxy as host:port')
+    work.add_argument('--concurrency', type=int, default=2, help='Jobs scraped at once, one tab each')
+    work.add_argument('--work_dir', type=str, default='.queue_work', help='Directory of scratch outputs')
+    work.add_argument('--lease_seconds', type=int, default=600, help='Lease duration, renewed every third of it')
+    work.add_argument('--max_attempts', type=int, default=3, help='Claims of a job before it is marked failed')
+    work.add_argument('--stall_seconds', type=int, default=None,
+                      help='Seconds without any scroll before a batch is given up on (default: lease_seconds)')
+    work.add_argument('--wait', action='store_true', help='Keep polling for new jobs once the queue is drained')
+
+    status = subparsers.add_parser('status', help='Show the job counts of every group')
+    status.add_argument('--queue', type=str, required=True, help='Queue database')
+    status.add_argument('--retry_failed', action='store_true', help='Queue the failed jobs again')
+
+    aggregate = subparsers.add_parser('aggregate', help='Write the reported tweets of every group to its output')
+    aggregate.add_argument('--queue', type=str, required=True, help='Queue database')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    if args.command == 'work':
+        proxy = None
+        if args.proxy:
+            host, _, port = args.proxy.partition(':')
+            proxy = {"host": host, "port": port}
+        completed = run_worker(args.queue, work_dir=args.work_dir, exit_when_idle=not args.wait,
+                               lease_seconds=args.lease_seconds, max_attempts=args.max_attempts,
+                               stall_seconds=args.stall_seconds, proxy=proxy, cookies_path=args.cookies_path,
+                               env_path=args.env_path, disable_images=True, concurrency=args.concurrency, headless=False,
+                               scroll_ratio=100)
+        print(f"{completed} jobs completed")
+        return
+
+    queue = JobQueue(args.queue)
+    try:
+        if args.command == 'status':
+            if args.retry_failed:
+                print(f"{queue.retry_failed()} failed jobs queued again")
+            for group in queue.groups():
+                print(f"{group}: {queue.counts(group)}")
+        elif args.command == 'aggregate':
+            for group, output_format in queue.groups().items():
+                queue.aggregate(group, output_format=output_format)
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    main()
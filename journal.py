@@ -0,0 +1,68 @@
+"""
+Append-only checkpoint journal for the tweets extracted from one search interval.
+"""
+
+import json
+import logging
+import os
+import time
+
+
+class TweetJournal:
+    """
+    Writes each extracted tweet once as a JSON line. The file is fsynced every
+    `fsync_every` tweets or `fsync_interval` seconds, so a killed run loses at
+    most one batch, and `replay` recovers everything that reached the disk.
+    The owner truncates the journal whenever its records are safely in the output.
+    """
+
+    def __init__(self, path, fsync_every=50, fsync_interval=5.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = open(path, "a", encoding="utf-8")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, tweet_id, tweet):
+        self._file.write(json.dumps({"id": tweet_id, "tweet": tweet}, ensure_ascii=False) + "\n")
+        self._pending += 1
+        if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def truncate(self):
+        """Drop every record, once the caller has made them durable elsewhere."""
+        if not self._file.closed:
+            self._file.flush()
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    @staticmethod
+    def replay(path):
+        """Yield (tweet_id, tweet) pairs from a journal, ignoring a torn last line."""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.info(f"Skipping truncated journal line in {path}")
+                    continue
+                yield record["id"], record["tweet"]
+
+    @staticmethod
+    def remove(path):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,82 @@
+"""
+Completion manifest of the search intervals of one ascrape output, used to resume
+by rescheduling only the intervals that didn't finish.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+# scroll_tweets stop reasons meaning the interval's timeline was read to its end
+COMPLETE_REASONS = {"end", "exhausted", "no_new_tweets"}
+
+
+class IntervalManifest:
+    """
+    JSON file mapping each interval url to its outcome: {"status": "done" | "failed",
+    "tweets": n, "scrolls": n, "reason": ..., "finished_at": ..., "since": ..., "until": ...}.
+    Owners record an interval only once its tweets are durable in the output, then call `save`.
+    """
+
+    def __init__(self, path, reset=False):
+        self.path = path
+        self.intervals = {}
+        if reset:
+            self.remove()
+        elif os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.intervals = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.info(f"Ignoring unreadable interval manifest {path}: {e}")
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def is_done(self, url):
+        return self.intervals.get(url, {}).get("status") == "done"
+
+    def is_saturated(self, url):
+        """Whether the interval was split because it held more tweets than one scroll session reaches."""
+        return self.intervals.get(url, {}).get("reason") == "saturated"
+
+    def covers(self, since, until):
+        """Whether the done intervals together span [since, until)."""
+        spans = sorted((entry["since"], entry["until"]) for entry in self.intervals.values()
+                       if entry.get("status") == "done" and "since" in entry)
+        covered, until = since.isoformat(), until.isoformat()
+        for span_since, span_until in spans:
+            if span_since > covered:
+                break
+            covered = max(covered, span_until)
+        return covered >= until
+
+    def pending(self, urls):
+        """The urls of `urls` that are missing from the manifest or didn't finish."""
+        return [url for url in urls if not self.is_done(url)]
+
+    def record(self, url, status, interval=None):
+        """Store the outcome of one interval from its fetch_tweets status dict."""
+        reason = status.get("reason")
+        entry = self.intervals[url] = {
+            "status": "done" if reason in COMPLETE_REASONS else "failed",
+            "tweets": status.get("tweets", 0),
+            "scrolls": status.get("scrolls", 0),
+            "reason": reason,
+            "finished_at": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        }
+        if interval is not None:
+            entry["since"], entry["until"] = (bound.isoformat() for bound in interval)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.intervals, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,216 @@
+"""
+JavaScript snippets evaluated inside X pages through CDP Runtime.evaluate.
+
+Every snippet returns a non-empty string (usually JSON) because nodriver's
+Tab.evaluate drops falsy return values.
+"""
+
+# Single pass over the rendered page to classify its state without waiting
+# for any element. Returns one of: ok, rate_limited, retry, suspended, end.
+PAGE_STATE_JS = """
+(() => {
+    const body = document.body;
+    if (!body) return 'ok';
+    const text = body.innerText || '';
+    if (text.includes('Your account is suspended')) return 'suspended';
+    if (text.includes('Something went wrong. Try reloading.')) return 'rate_limited';
+    const buttons = document.querySelectorAll('button, [role=button]');
+    for (const button of buttons) {
+        if ((button.innerText || '').trim() === 'Retry') return 'retry';
+    }
+    // only the empty-state element: 'No results for' may just be quoted in a tweet
+    if (document.querySelector('[data-testid=emptyState]')) return 'end';
+    return 'ok';
+})()
+"""
+
+# In-app navigation for a tab that already runs the X shell: push the new
+# route and let the client router render it. Format with the JSON-encoded url.
+# Returns 'full' when the tab is on another origin or the app is not loaded.
+NAVIGATE_JS = """
+((url) => {
+    const target = new URL(url, location.href);
+    if (location.host !== target.host || !document.getElementById('react-root')) return 'full';
+    history.pushState({}, '', target.pathname + target.search + target.hash);
+    window.dispatchEvent(new PopStateEvent('popstate', {state: {}}));
+    window.scrollTo(0, 0);
+    return 'in_app';
+})(%s)
+"""
+
+# Used JS heap of the page in bytes, '0' when the browser doesn't expose it.
+HEAP_SIZE_JS = """
+String(performance.memory ? performance.memory.usedJSHeapSize : 0)
+"""
+
+# In-page equivalent of parsers.extract_tweet for every rendered tweet article
+# not reported since the last RESET_EXTRACTOR_JS. Returns a JSON array of
+# [tweet_id, tweet] pairs with the same fields as the Python extraction.
+EXTRACT_TWEETS_JS = """
+(() => {
+    const reported = window.__scweetReported || (window.__scweetReported = new Set());
+    // BeautifulSoup get_text(strip=True): stripped text nodes joined together
+    const getText = (el) => {
+        const parts = [];
+        const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+        while (walker.nextNode()) {
+            const text = walker.currentNode.nodeValue.trim();
+            if (text) parts.push(text);
+        }
+        return parts.join('');
+    };
+    // BeautifulSoup .string: text of an element whose only (nested) child is text
+    const getString = (el) => {
+        const kids = [];
+        for (const node of el.childNodes) {
+            if (node.nodeType === Node.TEXT_NODE) {
+                if (!node.nodeValue) continue;
+                const last = kids[kids.length - 1];
+                if (last && last.nodeType === Node.TEXT_NODE) {
+                    kids[kids.length - 1] = {nodeType: Node.TEXT_NODE, nodeValue: last.nodeValue + node.nodeValue};
+                    continue;
+                }
+            }
+            kids.push(node);
+        }
+        if (kids.length !== 1) return null;
+        const node = kids[0];
+        if (node.nodeType === Node.TEXT_NODE || node.nodeType === Node.COMMENT_NODE) return node.nodeValue;
+        return node.nodeType === Node.ELEMENT_NODE ? getString(node) : null;
+    };
+    const count = (el) => {
+        const match = el ? (el.getAttribute('aria-label') || '').match(/(\\d+)/) : null;
+        return match ? match[1] : '0';
+    };
+    const out = [];
+    for (const article of document.querySelectorAll('article[data-testid=tweet]')) {
+        const urlTag = article.querySelector('a[href*="/status/"]');
+        const tweetUrl = urlTag ? urlTag.getAttribute('href') : '';
+        const tweetId = tweetUrl.split('/').pop();
+        if (reported.has(tweetId)) continue;
+        reported.add(tweetId);
+
+        const spans = Array.from(article.querySelectorAll('span'));
+        if (spans.some((span) => getString(span) === 'Promoted')) continue;
+        const handleTag = spans.find((span) => (getString(span) || '').includes('@'));
+        const timeTag = article.querySelector('time');
+        const textDiv = article.querySelector('div[data-testid="tweetText"]');
+        const embeddedDiv = article.querySelector(':scope div:nth-of-type(2) > div:nth-of-type(2) > div:nth-of-type(2)');
+        const imageLinks = Array.from(article.querySelectorAll(':scope div:nth-of-type(2) > div:nth-of-type(2) img'))
+            .map((img) => img.getAttribute('src') || '')
+            .filter((src) => src.includes('https://pbs.twimg.com/'));
+        const emojis = [];
+        for (const img of article.querySelectorAll('img[src*="emoji"]')) {
+            const match = (img.getAttribute('src') || '').match(/svg\\/([a-z0-9]+)\\.svg/);
+            if (!match || !/^[0-9a-f]+$/.test(match[1])) continue;
+            try { emojis.push(String.fromCodePoint(parseInt(match[1], 16))); } catch (e) {}
+        }
+        out.push([tweetId, {
+            username: spans.length ? getText(spans[0]) : '',
+            handle: handleTag ? getText(handleTag) : '',
+            postdate: timeTag ? (timeTag.getAttribute('datetime') || '') : '',
+            text: textDiv ? getText(textDiv) : '',
+            embedded: embeddedDiv ? getText(embeddedDiv) : '',
+            emojis: emojis.join(' '),
+            reply_cnt: count(article.querySelector('button[data-testid="reply"]')),
+            retweet_cnt: count(article.querySelector('button[data-testid="retweet"]')),
+            like_cnt: count(article.querySelector('button[data-testid="like"]')),
+            image_links: imageLinks,
+            tweet_url: tweetUrl,
+        }]);
+    }
+    return JSON.stringify(out);
+})()
+"""
+
+# Forget which tweets EXTRACT_TWEETS_JS already reported, e.g. when a pooled
+# tab starts a new interval.
+RESET_EXTRACTOR_JS = """
+(() => { window.__scweetReported = new Set(); return 'ok'; })()
+"""
+
+# Count the timeline cells (div[data-testid=cellInnerDiv]) the page renders from
+# now on, and wake the pending WAIT_FOR_CELLS_JS promises on each batch.
+# Idempotent: survives in-app navigation. Returns the current cell count.
+INSTALL_CELL_OBSERVER_JS = """
+(() => {
+    if (!window.__scweetObserver && document.body) {
+        window.__scweetCells = 0;
+        window.__scweetWaiters = new Set();
+        window.__scweetObserver = new MutationObserver((mutations) => {
+            let added = 0;
+            for (const mutation of mutations) {
+                for (const node of mutation.addedNodes) {
+                    if (node.nodeType !== Node.ELEMENT_NODE) continue;
+                    if (node.matches('[data-testid=cellInnerDiv]')) added += 1;
+                    else added += node.querySelectorAll('[data-testid=cellInnerDiv]').length;
+                }
+            }
+            if (!added) return;
+            window.__scweetCells += added;
+            for (const waiter of window.__scweetWaiters) waiter();
+        });
+        window.__scweetObserver.observe(document.body, {childList: true, subtree: true});
+    }
+    return String(window.__scweetCells || 0);
+})()
+"""
+
+# Promise resolved once more than `since` cells rendered and no new one came for
+# `quiet` ms, or after `timeout` ms. Format with (since, timeout, quiet).
+# Resolves to JSON {cells, first}: the cell count and the ms until the first new
+# cell (-1 on timeout).
+WAIT_FOR_CELLS_JS = """
+new Promise((resolve) => {
+    const since = %d, timeout = %d, quiet = %d;
+    const start = performance.now();
+    let first = -1, quietTimer = null, deadline = null;
+    const finish = () => {
+        clearTimeout(quietTimer);
+        clearTimeout(deadline);
+        window.__scweetWaiters.delete(onCells);
+        resolve(JSON.stringify({cells: window.__scweetCells, first: Math.round(first)}));
+    };
+    const onCells = () => {
+        if (first < 0) first = performance.now() - start;
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(finish, quiet);
+    };
+    if (!window.__scweetWaiters) return resolve(JSON.stringify({cells: 0, first: -1}));
+    deadline = setTimeout(finish, timeout);
+    window.__scweetWaiters.add(onCells);
+    if (window.__scweetCells > since) onCells();
+})
+"""
+
+# Status ids of the tweet articles currently rendered, as a JSON array.
+VISIBLE_IDS_JS = """
+JSON.stringify(Array.from(document.querySelectorAll('article[data-testid=tweet]'), (article) => {
+    const link = article.querySelector('a[href*="/status/"]');
+    return link ? link.getAttribute('href').split('/').pop() : null;
+}).filter((id) => id))
+"""
+
+# Empty the tweet articles already recorded by Python that sit more than one
+# viewport above the visible area. Each cell keeps its height so the scroll
+# position and X's load-more anchor don't move. Format with the JSON array of
+# newly recorded ids. Returns the number of articles pruned, as a string.
+PRUNE_ARTICLES_JS = """
+((recordedIds) => {
+    const recorded = window.__scweetRecorded || (window.__scweetRecorded = new Set());
+    for (const id of recordedIds) recorded.add(id);
+    let pruned = 0;
+    for (const article of document.querySelectorAll('article[data-testid=tweet]')) {
+        const link = article.querySelector('a[href*="/status/"]');
+        if (!link || !recorded.has(link.getAttribute('href').split('/').pop())) continue;
+        const cell = article.closest('[data-testid=cellInnerDiv]') || article;
+        const rect = cell.getBoundingClientRect();
+        if (rect.bottom > -window.innerHeight) continue;
+        cell.style.minHeight = rect.height + 'px';
+        article.removeAttribute('data-testid');
+        article.replaceChildren();
+        pruned += 1;
+    }
+    return String(pruned);
+})(%s)
+"""
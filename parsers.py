@@ -0,0 +1,363 @@
+"""
+Tweet and profile extraction from page HTML. Kept free of browser dependencies
+so the functions can run in worker processes.
+
+Two backends produce identical dicts: "bs4" (BeautifulSoup with html.parser)
+and "lxml" (lxml.html with precompiled XPath).
+"""
+
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+from utils import extract_count_from_aria_label, iter_tweet_articles
+
+
+def parse_followers(text):
+    text = text.split(' ')[0]
+    if 'K' in text:
+        followers = int(float(text.replace('K', '')) * 1000)
+    elif 'M' in text:
+        followers = int(float(text.replace('M', '')) * 1000000)
+    else:
+        text = text.replace(',', '')
+        followers = int(text)
+    return followers
+
+
+def extract_tweet(post_soup):
+    # username
+    username_tag = post_soup.find('span')
+    username = username_tag.get_text(strip=True) if username_tag else ""
+
+    # handle: a span with '@'
+    handle_tag = post_soup.find('span', text=lambda t: t and '@' in t)
+    handle = handle_tag.get_text(strip=True) if handle_tag else ""
+
+    # postdate: <time datetime="...">
+    time_tag = post_soup.find('time')
+    postdate = time_tag['datetime'] if time_tag and time_tag.has_attr('datetime') else ""
+
+    # Full tweet text from div[data-testid=tweetText]
+    tweet_text_div = post_soup.select_one('div[data-testid="tweetText"]')
+    text = tweet_text_div.get_text(strip=True) if tweet_text_div else ""
+
+    # embedded text (as previously handled); positional selectors are scoped to the
+    # article, so they match the same nodes whether or not its parents are in the tree
+    embedded_div = post_soup.select_one(':scope div:nth-of-type(2) > div:nth-of-type(2) > div:nth-of-type(2)')
+    embedded = embedded_div.get_text(strip=True) if embedded_div else ""
+
+    # Counts from aria-label
+    reply_div = post_soup.find('button', {'data-testid': 'reply'})
+    retweet_div = post_soup.find('button', {'data-testid': 'retweet'})
+    like_div = post_soup.find('button', {'data-testid': 'like'})
+
+    reply_cnt = extract_count_from_aria_label(reply_div)
+    retweet_cnt = extract_count_from_aria_label(retweet_div)
+    like_cnt = extract_count_from_aria_label(like_div)
+
+    # image links
+    image_links = []
+    image_tags = post_soup.select(':scope div:nth-of-type(2) > div:nth-of-type(2) img')
+    for img in image_tags:
+        src = img.get('src', '')
+        if 'https://pbs.twimg.com/' in src:
+            image_links.append(src)
+
+    # Check if promoted
+    promoted_tag = post_soup.find('span', text='Promoted')
+    if promoted_tag:
+        return None  # Ignore promoted tweets
+
+    # Emojis
+    emoji_tags = post_soup.find_all('img', src=lambda s: s and 'emoji' in s)
+    emojis = decode_emojis(tag.get('src', '') for tag in emoji_tags)
+
+    # tweet URL: <a href="/.../status/...">
+    url_tag = post_soup.find('a', href=lambda h: h and '/status/' in h)
+    tweet_url = url_tag['href'] if url_tag else ""
+
+    tweet = {
+        "username": username,
+        "handle": handle,
+        "postdate": postdate,
+        "text": text,
+        "embedded": embedded,  # reverted to embedded logic
+        "emojis": emojis,
+        "reply_cnt": reply_cnt,
+        "retweet_cnt": retweet_cnt,
+        "like_cnt": like_cnt,
+        "image_links": image_links,
+        "tweet_url": tweet_url
+    }
+
+    return tweet
+
+
+def extract_profile(soup):
+    # Extract following using the element that shows following count.
+    try:
+        # This selector finds an <a> whose href contains "/following", then finds a nested span with text.
+        following_elem = soup.select_one('a[href*="/following"] span span')
+        following = following_elem.get_text(strip=True) if following_elem else None
+        if following:
+            following = parse_followers(following)
+    except Exception:
+        following = None
+
+    # Extract verified followers from the corresponding element.
+    try:
+        verified_elem = soup.select_one('a[href*="/verified_followers"] span span')
+        verified_followers = verified_elem.get_text(strip=True) if verified_elem else None
+        if verified_followers:
+            verified_followers = parse_followers(verified_followers)
+    except Exception:
+        verified_followers = None
+
+    # Extract username (display name) from the element with data-testid="UserName".
+    try:
+        username_elem = soup.select_one('div[data-testid="UserName"] span')
+        username = username_elem.get_text(strip=True) if username_elem else None
+    except Exception:
+        username = None
+
+    # Extract location using the element with data-testid "UserLocation".
+    try:
+        location_elem = soup.select_one('span[data-testid="UserLocation"] span')
+        location = location_elem.get_text(strip=True) if location_elem else ""
+    except Exception:
+        location = ""
+
+    # Extract website using the element with data-testid "UserUrl"; we use the href attribute.
+    try:
+        website_elem = soup.select_one('a[data-testid="UserUrl"]')
+        website = website_elem.get("href", "") if website_elem else ""
+    except Exception:
+        website = ""
+
+    # Extract join date using the element with data-testid "UserJoinDate".
+    try:
+        join_date_elem = soup.select_one('span[data-testid="UserJoinDate"] span')
+        join_date = join_date_elem.get_text(strip=True) if join_date_elem else ""
+    except Exception:
+        join_date = ""
+
+    # Extract profile description from the element with data-testid "UserDescription".
+    try:
+        desc_elem = soup.select_one('div[data-testid="UserDescription"]')
+        desc = desc_elem.get_text(strip=True) if desc_elem else ""
+    except Exception:
+        desc = ""
+
+    # Build the profile dictionary.
+    profile = {
+        "username": username,
+        "following": following,
+        "verified_followers": verified_followers,
+        "location": location,
+        "website": website,
+        "join_date": join_date,
+        "description": desc
+    }
+    return profile
+
+
+def decode_emojis(srcs):
+    emoji_list = []
+    for filename in srcs:
+        match = re.search(r'svg/([a-z0-9]+)\.svg', filename)
+        if match:
+            try:
+                emoji_cp = int(match.group(1), 16)
+                emoji = chr(emoji_cp)
+                emoji_list.append(emoji)
+            except ValueError:
+                continue
+    return ' '.join(emoji_list)
+
+
+class BeautifulSoupBackend:
+    name = "bs4"
+
+    def parse_tweet(self, article_html):
+        return extract_tweet(BeautifulSoup(article_html, 'html.parser').article)
+
+    def parse_profile(self, html):
+        return extract_profile(BeautifulSoup(html, 'html.parser'))
+
+
+def _lxml_text(element):
+    """Same result as BeautifulSoup's get_text(strip=True): stripped text nodes, joined."""
+    parts = []
+
+    def walk(node):
+        if node.text and node.text.strip():
+            parts.append(node.text.strip())
+        for child in node:
+            # comments and processing instructions contribute only their tail
+            if isinstance(child.tag, str):
+                walk(child)
+            if child.tail and child.tail.strip():
+                parts.append(child.tail.strip())
+
+    walk(element)
+    return "".join(parts)
+
+
+def _lxml_string(element):
+    """Same result as BeautifulSoup's .string: the text of an element with a single (nested) text child."""
+    children = list(element)
+    n_nodes = (1 if element.text else 0) + sum(2 if child.tail else 1 for child in children)
+    if n_nodes != 1:
+        return None
+    if element.text:
+        return element.text
+    child = children[0]
+    if not isinstance(child.tag, str):
+        return child.text
+    return _lxml_string(child)
+
+
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+
+class LxmlBackend:
+    name = "lxml"
+
+    def __init__(self):
+        if lxml is None:
+            raise ImportError("parser='lxml' requires lxml: pip install lxml")
+        # XPath equivalents of the CSS selectors used by extract_tweet / extract_profile,
+        # evaluated from the article node like the :scope selectors
+        self.tweet_text = etree.XPath('.//div[@data-testid="tweetText"]')
+        self.embedded = etree.XPath('.//div[2]/div[2]/div[2]')
+        self.images = etree.XPath('.//div[2]/div[2]//img')
+        self.reply = etree.XPath('.//button[@data-testid="reply"]')
+        self.retweet = etree.XPath('.//button[@data-testid="retweet"]')
+        self.like = etree.XPath('.//button[@data-testid="like"]')
+        self.emojis = etree.XPath('.//img[contains(@src, "emoji")]')
+        self.tweet_url = etree.XPath('.//a[contains(@href, "/status/")]')
+        self.following = etree.XPath('.//a[contains(@href, "/following")]//span//span')
+        self.verified_followers = etree.XPath('.//a[contains(@href, "/verified_followers")]//span//span')
+        self.username = etree.XPath('.//div[@data-testid="UserName"]//span')
+        self.location = etree.XPath('.//span[@data-testid="UserLocation"]//span')
+        self.website = etree.XPath('.//a[@data-testid="UserUrl"]')
+        self.join_date = etree.XPath('.//span[@data-testid="UserJoinDate"]//span')
+        self.description = etree.XPath('.//div[@data-testid="UserDescription"]')
+
+    def parse_tweet(self, article_html):
+        post = lxml.html.fragment_fromstring(article_html)
+        spans = list(post.iter('span'))
+
+        username_tag = _first(spans)
+        username = _lxml_text(username_tag) if username_tag is not None else ""
+
+        handle_tag = next((span for span in spans if '@' in (_lxml_string(span) or '')), None)
+        handle = _lxml_text(handle_tag) if handle_tag is not None else ""
+
+        time_tag = next(post.iter('time'), None)
+        postdate = time_tag.get('datetime', "") if time_tag is not None else ""
+
+        tweet_text_div = _first(self.tweet_text(post))
+        text = _lxml_text(tweet_text_div) if tweet_text_div is not None else ""
+
+        embedded_div = _first(self.embedded(post))
+        embedded = _lxml_text(embedded_div) if embedded_div is not None else ""
+
+        reply_cnt = extract_count_from_aria_label(_first(self.reply(post)))
+        retweet_cnt = extract_count_from_aria_label(_first(self.retweet(post)))
+        like_cnt = extract_count_from_aria_label(_first(self.like(post)))
+
+        image_links = [img.get('src', '') for img in self.images(post)
+                       if 'https://pbs.twimg.com/' in img.get('src', '')]
+
+        if any(_lxml_string(span) == 'Promoted' for span in spans):
+            return None  # Ignore promoted tweets
+
+        emojis = decode_emojis(img.get('src', '') for img in self.emojis(post))
+
+        url_tag = _first(self.tweet_url(post))
+        tweet_url = url_tag.get('href') if url_tag is not None else ""
+
+        return {
+            "username": username,
+            "handle": handle,
+            "postdate": postdate,
+            "text": text,
+            "embedded": embedded,
+            "emojis": emojis,
+            "reply_cnt": reply_cnt,
+            "retweet_cnt": retweet_cnt,
+            "like_cnt": like_cnt,
+            "image_links": image_links,
+            "tweet_url": tweet_url
+        }
+
+    def parse_profile(self, html):
+        doc = lxml.html.document_fromstring(html)
+
+        def count(xpath):
+            try:
+                elem = _first(xpath(doc))
+                value = _lxml_text(elem) if elem is not None else None
+                return parse_followers(value) if value else value
+            except Exception:
+                return None
+
+        def text(xpath, default):
+            elem = _first(xpath(doc))
+            return _lxml_text(elem) if elem is not None else default
+
+        website_elem = _first(self.website(doc))
+        return {
+            "username": text(self.username, None),
+            "following": count(self.following),
+            "verified_followers": count(self.verified_followers),
+            "location": text(self.location, ""),
+            "website": website_elem.get("href", "") if website_elem is not None else "",
+            "join_date": text(self.join_date, ""),
+            "description": text(self.description, "")
+        }
+
+
+PARSER_BACKENDS = {
+    "bs4": BeautifulSoupBackend,
+    "lxml": LxmlBackend,
+}
+_backends = {}
+
+
+def get_parser_backend(name="bs4"):
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"parser must be one of {set(PARSER_BACKENDS)}")
+    if name not in _backends:
+        _backends[name] = PARSER_BACKENDS[name]()
+    return _backends[name]
+
+
+def parse_articles(articles_html, backend="bs4"):
+    """Extract (tweet_id, tweet) records from article HTML, as yielded by iter_tweet_articles."""
+    parser = get_parser_backend(backend)
+    records = []
+    for article_html in articles_html:
+        data = parser.parse_tweet(article_html)
+        if data:
+            # Use the tweet_url as key
+            records.append((data['tweet_url'].split("/")[-1], data))
+    return records
+
+
+def parse_tweets(html_content, seen_ids=(), backend="bs4"):
+    """
+    Extract (tweet_id, tweet) records from a timeline snapshot, running the full
+    extraction only for articles whose status id is not in seen_ids.
+    """
+    return parse_articles((article_html for tweet_id, article_html in iter_tweet_articles(html_content)
+                           if tweet_id not in seen_ids), backend)
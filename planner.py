@@ -0,0 +1,219 @@
+"""
+Scheduling of the search intervals and the tweet budget of ascrape runs
+across the tab workers.
+"""
+
+import asyncio
+import logging
+import math
+from collections import deque
+from datetime import datetime, timedelta
+
+from manifest import COMPLETE_REASONS
+
+
+def split_intervals(since_dt, until_dt, n):
+    """
+    The (since, until) datetimes build_search_url splits [since_dt, until_dt] into
+    (n=-1: one per day): whole days when intervals last a day or more, exact sub-day
+    bounds otherwise. The intervals are contiguous and the last one ends at until_dt;
+    intervals that rounding to days made empty or overlapping are dropped or trimmed.
+    """
+    if until_dt <= since_dt:
+        until_dt = since_dt + timedelta(days=1)
+    total_days = (until_dt - since_dt).total_seconds() / 86400
+    if n == -1:
+        n = max(math.ceil(total_days), 1)
+        interval = 1
+    else:
+        interval = total_days / n
+    day_bounds = interval >= 1 and since_dt.time() == until_dt.time() == datetime.min.time()
+    intervals = []
+    for i in range(n):
+        current_since = since_dt + timedelta(days=i * interval)
+        current_until = until_dt if i == n - 1 else min(since_dt + timedelta(days=(i + 1) * interval), until_dt)
+        if day_bounds:
+            current_since = datetime.combine(current_since.date(), datetime.min.time())
+            current_until = datetime.combine(current_until.date(), datetime.min.time())
+        else:
+            current_since = current_since.replace(microsecond=0)
+            current_until = current_until.replace(microsecond=0)
+        if intervals and intervals[-1][1] != current_since:
+            # keep the intervals contiguous whatever the rounding did
+            current_since = intervals[-1][1]
+        if current_since < current_until:
+            intervals.append((current_since, current_until))
+        if current_until >= until_dt:
+            break
+    return intervals
+
+
+class IntervalPlanner:
+    """
+    Hands out the (since, until) intervals left to scrape, skipping the ones the
+    manifest has done. With `adaptive`, an interval that saturates (scroll cap
+    reached or at least `saturation_tweets` tweets) is split in half, at a day
+    boundary while it spans several days and down to `min_span` below that, and both
+    halves are queued again; one that stays under `sparse_tweets` lets the next
+    two pending intervals after it be merged when their estimated count stays low.
+    Workers call `get` until it returns None and report each interval to `done`.
+    """
+
+    def __init__(self, intervals, build_url, manifest, adaptive=False,
+                 saturation_tweets=2000, sparse_tweets=100, min_span=timedelta(minutes=15)):
+        self.pending = deque(intervals)
+        self.build_url = build_url
+        self.manifest = manifest
+        self.adaptive = adaptive
+        self.saturation_tweets = saturation_tweets
+        self.sparse_tweets = sparse_tweets
+        self.min_span = min_span
+        self.in_flight = 0
+        self.stopped = False
+        self.splits = 0
+        self.merges = 0
+        self._next_index = 0
+        self._changed = asyncio.Condition()
+
+    async def get(self):
+        """Next (index, url, interval) to scrape, or None once nothing is pending or in flight."""
+        async with self._changed:
+            while True:
+                task = self._next_task()
+                if task is not None:
+                    return task
+                if not self.in_flight:
+                    return None
+                await self._changed.wait()
+
+    async def done(self, interval, status):
+        """Take back a finished interval. Sets status["reason"] to "saturated" when it was split."""
+        async with self._changed:
+            self.in_flight -= 1
+            # the intervals still in flight when stopped must not queue their halves
+            if self.adaptive and not self.stopped:
+                self._adapt(interval, status)
+            self._changed.notify_all()
+
+    def stop(self):
+        """Drop the pending intervals, e.g. once the tweet limit is reached, and queue no more."""
+        self.stopped = True
+        self.pending.clear()
+
+    def _next_task(self):
+        """Pop the next interval left to scrape without waiting, None if nothing is pending."""
+        while self.pending:
+            interval = self.pending.popleft()
+            url = self.build_url(*interval)
+            if self.manifest.is_done(url) or self.manifest.covers(*interval):
+                continue
+            # saturated in a previous run: go straight to its halves
+            if self.adaptive and self.manifest.is_saturated(url) and self._split(interval):
+                continue
+            self.in_flight += 1
+            index = self._next_index
+            self._next_index += 1
+            return index, url, interval
+        return None
+
+    def _adapt(self, interval, status):
+        tweets = status.get("tweets", 0)
+        reason = status.get("reason")
+        if reason == "max_scrolls" or tweets >= self.saturation_tweets:
+            if self._split(interval):
+                status["reason"] = "saturated"
+        elif reason in COMPLETE_REASONS and tweets < self.sparse_tweets:
+            days = (interval[1] - interval[0]).total_seconds() / 86400
+            self._merge_after(interval, tweets / days)
+
+    def _split(self, interval):
+        since, until = interval
+        span = until - since
+        if span >= timedelta(days=2):
+            middle = since + timedelta(days=span.days // 2)
+        elif span >= 2 * self.min_span:
+            middle = since + timedelta(seconds=span.total_seconds() // 2)
+        else:
+            return False
+        self.pending.appendleft((middle, until))
+        self.pending.appendleft((since, middle))
+        self.splits += 1
+        logging.info(f"Interval {since}..{until} saturated, split at {middle}")
+        return True
+
+    def _merge_after(self, interval, tweets_per_day):
+        """Merge the first two pending intervals after a sparse one, if they are contiguous."""
+        for i in range(len(self.pending) - 1):
+            first, second = self.pending[i], self.pending[i + 1]
+            if first[0] < interval[1]:
+                continue
+            if first[1] != second[0]:
+                return
+            if any(self.manifest.is_done(self.build_url(*candidate)) for candidate in (first, second)):
+                return
+            merged = (first[0], second[1])
+            if tweets_per_day * (merged[1] - merged[0]).total_seconds() / 86400 >= self.saturation_tweets / 2:
+                return
+            del self.pending[i + 1]
+            self.pending[i] = merged
+            self.merges += 1
+            logging.info(f"Sparse interval before {merged[0]}, merged {merged[0]}..{merged[1]}")
+            return
+
+
+class PlannerGroup:
+    """
+    Hands out the intervals of several planners to one pool of workers, taking
+    them round-robin so every output progresses while tabs are shared. The
+    planners are switched to one shared condition, so an interval finished in any
+    of them (a split may queue new work) wakes the waiting workers.
+    """
+
+    def __init__(self, planners):
+        self.planners = list(planners)
+        self._changed = asyncio.Condition()
+        for planner in self.planners:
+            planner._changed = self._changed
+        self._turn = 0
+
+    async def get(self):
+        """Next (position of the planner, (index, url, interval)), or None once every planner is finished."""
+        async with self._changed:
+            while True:
+                for _ in range(len(self.planners)):
+                    position = self._turn
+                    self._turn = (self._turn + 1) % len(self.planners)
+                    task = self.planners[position]._next_task()
+                    if task is not None:
+                        return position, task
+                if not any(planner.in_flight for planner in self.planners):
+                    return None
+                await self._changed.wait()
+
+
+class TweetBudget:
+    """
+    Tweets left to emit across every tab of a run. Workers `take` one per tweet they
+    write; `exhausted` is set as soon as the limit is reached, so every scroll loop
+    can stop instead of scrolling on to its own limit.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.exhausted = asyncio.Event()
+        if limit <= 0:
+            self.exhausted.set()
+
+    @property
+    def remaining(self):
+        return self.limit - self.used
+
+    def take(self):
+        """Claim one tweet, False once the budget is spent."""
+        if self.exhausted.is_set():
+            return False
+        self.used += 1
+        if self.used >= self.limit:
+            self.exhausted.set()
+        return True
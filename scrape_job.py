@@ -0,0 +1,137 @@
+"""
+State of one ascrape output while tab workers scrape its intervals: the sink,
+journals, id index, interval manifest, planner and tweet budget.
+"""
+
+import glob
+import logging
+import os
+
+from dedup import TweetIdIndex
+from journal import TweetJournal
+from manifest import IntervalManifest
+from planner import IntervalPlanner, TweetBudget
+
+
+class ScrapeJob:
+    """
+    Everything one output needs between Scweet.prepare_scrape and the end of the
+    run. Several jobs can share one browser: workers take (job, interval) pairs,
+    open an interval journal with `start_interval`, stream tweets through
+    `write_tweet` and hand the outcome back with `finish_interval`.
+    """
+
+    def __init__(self, name, path, sink_class, intervals, build_url, append=False, limit=float("inf"),
+                 keep_results=True, adaptive=False, saturation_tweets=2000, sparse_tweets=100):
+        self.name = name
+        self.path = path
+        self.sink_class = sink_class
+        self.append = append
+        self.limit = limit
+        self.keep_results = keep_results
+        self.all_data = {}
+        self.budget = TweetBudget(limit)
+        self.manifest = IntervalManifest(f"{path}.intervals.json", reset=not append)
+        self.planner = IntervalPlanner(intervals, build_url, self.manifest, adaptive=adaptive,
+                                       saturation_tweets=saturation_tweets, sparse_tweets=sparse_tweets)
+        self.sink = None
+        self.id_index = None
+
+        # Per-interval journals hold the tweets not yet flushed to the output
+        journal_dir = os.path.join(os.path.dirname(path) or ".", ".journal")
+        if not os.path.exists(journal_dir):
+            os.makedirs(journal_dir)
+        self.journal_prefix = os.path.join(journal_dir, os.path.basename(path))
+        self.journals = set()
+        # journals and outcomes of finished intervals, settled at the next durable flush
+        self.retired_journals = []
+        self.finished_intervals = []
+
+    def open(self):
+        """Open the id index and the sink, and recover what a killed run left in its journals."""
+        stale_journals = sorted(glob.glob(f"{glob.escape(self.journal_prefix)}.*.jsonl"))
+
+        # Ids already in the output, unless the sink dedups by itself
+        if not self.sink_class.upserts:
+            id_index_path = f"{self.path}.ids"
+            seed = self.append and not os.path.exists(id_index_path)
+            self.id_index = TweetIdIndex(id_index_path, reset=not self.append)
+            if seed:
+                # output written before the index existed: one full read
+                for tweet_id in self.sink_class.iter_ids(self.path):
+                    self.id_index.add(tweet_id)
+                self.id_index.commit()
+                self.id_index.compact()
+
+        self.sink = self.sink_class(self.path, append=self.append, on_flush=self.settle)
+        # Recover tweets a killed run extracted but never flushed to the output
+        for journal_path in stale_journals:
+            if self.append:
+                recovered = dict(TweetJournal.replay(journal_path))
+                for tweet_id, tweet_data in recovered.items():
+                    if not self.is_duplicate(tweet_id):
+                        self.sink.write(tweet_id, tweet_data)
+                logging.info(f"Recovered {len(recovered)} tweets from journal {journal_path}")
+            self.retired_journals.append(journal_path)
+        self.sink.flush()
+
+    def settle(self):
+        """Sink flush callback: everything written so far is durable in the output."""
+        if self.id_index is not None:
+            self.id_index.commit()
+        for journal in self.journals:
+            journal.truncate()
+        for journal_path in self.retired_journals:
+            TweetJournal.remove(journal_path)
+        self.retired_journals.clear()
+        for url, status, interval in self.finished_intervals:
+            self.manifest.record(url, status, interval)
+        if self.finished_intervals:
+            self.manifest.save()
+            self.finished_intervals.clear()
+
+    def is_duplicate(self, tweet_id):
+        if self.id_index is None:
+            return False
+        if tweet_id in self.id_index:
+            return True
+        self.id_index.add(tweet_id)
+        return False
+
+    def start_interval(self, index):
+        journal = TweetJournal(f"{self.journal_prefix}.{index}.jsonl")
+        self.journals.add(journal)
+        return journal
+
+    def write_tweet(self, journal, tweet_id, tweet_data):
+        if self.budget.exhausted.is_set() or self.is_duplicate(tweet_id):
+            return
+        self.budget.take()
+        # journal first: a flush triggered by the sink then truncates this record too
+        journal.append(tweet_id, tweet_data)
+        self.sink.write(tweet_id, tweet_data)
+        if self.keep_results:
+            self.all_data[tweet_id] = tweet_data
+        if self.budget.exhausted.is_set():
+            logging.info(f"[{self.name}] Reached limit of {self.limit} tweets. Stopping early.")
+            self.planner.stop()
+
+    async def finish_interval(self, journal, url, interval, status):
+        if self.budget.exhausted.is_set():
+            # tweets past the limit were dropped, the interval may be incomplete
+            status["reason"] = "limit"
+        await self.planner.done(interval, status)
+        self.journals.discard(journal)
+        journal.close()
+        self.retired_journals.append(journal.path)
+        self.finished_intervals.append((url, status, interval))
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+        if self.id_index is not None:
+            self.id_index.close()
+        manifest = self.manifest
+        logging.info(f"[{self.name}] {self.budget.used} tweets written, "
+                     f"{sum(manifest.is_done(url) for url in manifest.intervals)} intervals done, "
+                     f"{self.planner.splits} split and {self.planner.merges} merged")
@@ -0,0 +1,128 @@
+"""
+Scrolling of virtualized timelines: waiting for what a scroll loaded, driven by a
+MutationObserver in the page instead of fixed sleeps, sizing each scroll step and
+pruning the articles left behind.
+"""
+
+import json
+import logging
+import statistics
+from collections import deque
+
+from page_scripts import INSTALL_CELL_OBSERVER_JS, WAIT_FOR_CELLS_JS, VISIBLE_IDS_JS, PRUNE_ARTICLES_JS
+
+
+class ScrollWaiter:
+    """
+    Resolves each `wait` as soon as new timeline cells rendered and stopped coming
+    for `quiet` seconds. The timeout adapts to the tab: a few times the median
+    latency of the recent batches, kept within [min_timeout, max_timeout]. After
+    `stall_waits` waits in a row without any new cell, `stalled` tells the caller
+    the timeline has ended.
+    """
+
+    def __init__(self, tab, min_timeout=0.5, max_timeout=5.0, quiet=0.15, stall_waits=3):
+        self.tab = tab
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.quiet = quiet
+        self.stall_waits = stall_waits
+        self.cells = 0
+        self.empty_waits = 0
+        self._latencies = deque(maxlen=20)
+
+    @property
+    def timeout(self):
+        if len(self._latencies) < 3:
+            return self.max_timeout
+        return min(max(4 * statistics.median(self._latencies), self.min_timeout), self.max_timeout)
+
+    @property
+    def stalled(self):
+        return self.empty_waits >= self.stall_waits
+
+    async def install(self):
+        """Start observing the page; call again after a full page load."""
+        try:
+            self.cells = int(await self.tab.evaluate(INSTALL_CELL_OBSERVER_JS))
+        except Exception as e:
+            logging.info(f"Couldn't install the cell observer: {e}")
+        self.empty_waits = 0
+
+    async def wait(self):
+        """Wait for the cells the last scroll loads. Returns how many rendered."""
+        script = WAIT_FOR_CELLS_JS % (self.cells, self.timeout * 1000, self.quiet * 1000)
+        try:
+            result = json.loads(await self.tab.evaluate(script, await_promise=True))
+        except Exception as e:
+            logging.info(f"Cell wait failed, sleeping instead: {e}")
+            await self.tab.sleep(self.min_timeout)
+            return 0
+        if result["cells"] < self.cells:
+            # the page reloaded and lost the observer
+            await self.install()
+            return 0
+        new_cells = result["cells"] - self.cells
+        self.cells = result["cells"]
+        if result["first"] >= 0:
+            self._latencies.append(result["first"] / 1000)
+            self.empty_waits = 0
+        else:
+            self.empty_waits += 1
+        return new_cells
+
+
+class StepController:
+    """
+    Adjusts the scroll step (tab.scroll_down percentage) from how many of the items
+    rendered after a scroll were already rendered before it. No shared item means
+    the step may have jumped over part of the virtualized timeline, so it shrinks
+    sharply; a large overlap means the scroll mostly re-read items, so it grows.
+    Steps settle around `target_overlap` of the previous snapshot.
+    """
+
+    def __init__(self, ratio, min_ratio=20, max_ratio=400, target_overlap=0.2):
+        self.ratio = ratio
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.target_overlap = target_overlap
+        self.gaps = 0
+        self._previous = set()
+
+    def update(self, visible_ids):
+        """Feed the ids rendered after the last scroll; returns the next step."""
+        visible = set(visible_ids)
+        if self._previous and visible:
+            overlap = len(visible & self._previous) / len(self._previous)
+            if overlap == 0:
+                self.gaps += 1
+                self.ratio *= 0.5
+            elif overlap > 2 * self.target_overlap:
+                self.ratio *= 1.25
+            elif overlap < self.target_overlap / 2:
+                self.ratio *= 0.85
+            self.ratio = int(min(max(self.ratio, self.min_ratio), self.max_ratio))
+        if visible:
+            self._previous = visible
+        return self.ratio
+
+
+async def get_visible_tweet_ids(tab):
+    try:
+        return json.loads(await tab.evaluate(VISIBLE_IDS_JS))
+    except Exception as e:
+        logging.info(f"Couldn't read the visible tweet ids: {e}")
+        return []
+
+
+async def prune_articles(tab, tweet_ids):
+    """
+    Empty the rendered articles of the tweets recorded so far (`tweet_ids` are the
+    ones recorded since the previous call) once they are well above the viewport,
+    so the page DOM and get_content() stop growing. Returns the number pruned.
+    """
+    try:
+        return int(await tab.evaluate(PRUNE_ARTICLES_JS % json.dumps(list(tweet_ids))))
+    except Exception as e:
+        logging.info(f"Couldn't prune the timeline: {e}")
+        return 0
@@ -5,12 +5,13 @@ Da Lei modified
 import asyncio
 import logging
 import argparse
-import csv
-import json
 import re
 import os
 import math
-from datetime import datetime, timedelta, date
+import functools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date
 from typing import Awaitable, Callable, Optional, Union, List
 
 import platform
@@ -20,9 +21,18 @@ from requests.cookies import create_cookie
 from bs4 import BeautifulSoup
 from pyvirtualdisplay import Display
 
+from tab_pool import TabPool
+from planner import PlannerGroup, split_intervals
+from scrape_job import ScrapeJob
+from sinks import SINKS, CsvSink, output_path
+from timeline import TimelineCapture
+from scrolling import ScrollWaiter, StepController, get_visible_tweet_ids, prune_articles
+from snapshots import SnapshotQueue
+from parsers import extract_tweet, parse_articles, parse_tweets, get_parser_backend
 from const import get_username, get_password, get_email, get_email_password
 from utils import (check_element_if_exists_by_text, check_element_if_exists_by_css,
-                    get_code_from_email, extract_count_from_aria_label)
+                    get_code_from_email, get_page_state, extract_tweets_in_page, reset_page_extractor,
+                    interval_query, iter_tweet_articles)
 
 logging.getLogger('urllib3').setLevel(logging.WARNING)
 logging.getLogger('seleniumwire').setLevel(logging.ERROR)
@@ -32,24 +42,25 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s:%(message)s')
 # display = Display(visible=0, size=(1024, 768))
 
 
-def parse_followers(text):
-    text = text.split(' ')[0]
-    if 'K' in text:
-        followers = int(float(text.replace('K', '')) * 1000)
-    elif 'M' in text:
-        followers = int(float(text.replace('M', '')) * 1000000)
-    else:
-        text = text.replace(',', '')
-        followers = int(text)
-    return followers
-
-
 class Scweet:
     main_tab: uc.Tab
     def __init__(self, proxy=None, cookies=None, cookies_path=None, user_agent=None,
                  disable_images=False, env_path=None, n_splits=5, concurrency=5, headless=True, scroll_ratio=30,
-                 code_callback: Optional[Callable[[str, str], Awaitable[str]]] = None):
+                 code_callback: Optional[Callable[[str, str], Awaitable[str]]] = None,
+                 tab_max_uses=25, tab_max_heap_mb=512, parse_workers=0, parser="bs4", extraction="html",
+                 max_scrolls=None, adaptive_scroll=False, prune_dom=False, max_retries=3):
         self.driver = None
+        self.tab_pool = None
+        # parse_workers > 0 moves HTML parsing off the event loop into worker processes
+        self.parse_executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 0 else None
+        # HTML parser backend for tweets and profiles: "bs4" or "lxml"
+        self.parser = get_parser_backend(parser)
+        # "html" pulls the page HTML and parses it in Python, "js" extracts the tweets inside the page,
+        # "network" decodes the timeline API responses the page fetches
+        extraction_allowed = {"html", "js", "network"}
+        if extraction not in extraction_allowed:
+            raise ValueError(f"extraction must be one of {extraction_allowed}")
+        self.extraction = extraction
         self.proxy = proxy
         self.cookies = cookies
         self.user_agent = user_agent
@@ -60,8 +71,21 @@ class Scweet:
         self.concurrency = concurrency
         self.headless = headless
         self.scroll_ratio = scroll_ratio
+        # adapt the scroll step to the overlap between consecutive snapshots, starting from scroll_ratio
+        self.adaptive_scroll = adaptive_scroll
+        # empty the timeline articles already extracted so per-scroll cost and page memory stay flat
+        self.prune_dom = prune_dom
+        # scrolls after which an interval is given up on, None scrolls until the timeline ends
+        self.max_scrolls = max_scrolls
+        # consecutive Retry clicks after which an interval is given up on as failed
+        self.max_retries = max_retries
+        # tabs are recycled after this many intervals/profiles or once their JS heap exceeds this size
+        self.tab_max_uses = tab_max_uses
+        self.tab_max_heap_mb = tab_max_heap_mb
         self.logged_in = False
         self.suspended = False
+        # monotonic time of the last scroll of any tab, for callers watching for a hung browser
+        self.last_activity = time.monotonic()
         # If no custom code callback is provided, use the default get_code_from_email for mailtm
         self.code_callback = code_callback or get_code_from_email
         self.display = None
@@ -87,6 +111,8 @@ class Scweet:
         if self.disable_images:
             config.add_argument(f'--blink-settings=imagesEnabled=false')
         self.driver = await uc.start(config)
+        self.tab_pool = TabPool(self.driver, self.concurrency, max_uses=self.tab_max_uses,
+                                max_heap_mb=self.tab_max_heap_mb)
         self.main_tab = await self.driver.get("draft:,")
         if self.proxy:
             self.main_tab.add_handler(uc.cdp.fetch.RequestPaused, self.req_paused)
@@ -311,82 +337,7 @@ class Scweet:
             self.driver.cookies.set_cookie(c)
 
     async def get_data(self, post_soup):
-        # username
-        username_tag = post_soup.find('span')
-        username = username_tag.get_text(strip=True) if username_tag else ""
-
-        # handle: a span with '@'
-        handle_tag = post_soup.find('span', text=lambda t: t and '@' in t)
-        handle = handle_tag.get_text(strip=True) if handle_tag else ""
-
-        # postdate: <time datetime="...">
-        time_tag = post_soup.find('time')
-        postdate = time_tag['datetime'] if time_tag and time_tag.has_attr('datetime') else ""
-
-        # Full tweet text from div[data-testid=tweetText]
-        tweet_text_div = post_soup.select_one('div[data-testid="tweetText"]')
-        text = tweet_text_div.get_text(strip=True) if tweet_text_div else ""
-
-        # embedded text (as previously handled)
-        embedded_div = post_soup.select_one('div:nth-of-type(2) > div:nth-of-type(2) > div:nth-of-type(2)')
-        embedded = embedded_div.get_text(strip=True) if embedded_div else ""
-
-        # Counts from aria-label
-        reply_div = post_soup.find('button', {'data-testid': 'reply'})
-        retweet_div = post_soup.find('button', {'data-testid': 'retweet'})
-        like_div = post_soup.find('button', {'data-testid': 'like'})
-
-        reply_cnt = extract_count_from_aria_label(reply_div)
-        retweet_cnt = extract_count_from_aria_label(retweet_div)
-        like_cnt = extract_count_from_aria_label(like_div)
-
-        # image links
-        image_links = []
-        image_tags = post_soup.select('div:nth-of-type(2) > div:nth-of-type(2) img')
-        for img in image_tags:
-            src = img.get('src', '')
-            if 'https://pbs.twimg.com/' in src:
-                image_links.append(src)
-
-        # Check if promoted
-        promoted_tag = post_soup.find('span', text='Promoted')
-        if promoted_tag:
-            return None  # Ignore promoted tweets
-
-        # Emojis
-        emoji_tags = post_soup.find_all('img', src=lambda s: s and 'emoji' in s)
-        emoji_list = []
-        for tag in emoji_tags:
-            filename = tag.get('src', '')
-            match = re.search(r'svg/([a-z0-9]+)\.svg', filename)
-            if match:
-                try:
-                    emoji_cp = int(match.group(1), 16)
-                    emoji = chr(emoji_cp)
-                    emoji_list.append(emoji)
-                except ValueError:
-                    continue
-        emojis = ' '.join(emoji_list)
-
-        # tweet URL: <a href="/.../status/...">
-        url_tag = post_soup.find('a', href=lambda h: h and '/status/' in h)
-        tweet_url = url_tag['href'] if url_tag else ""
-
-        tweet = {
-            "username": username,
-            "handle": handle,
-            "postdate": postdate,
-            "text": text,
-            "embedded": embedded,  # reverted to embedded logic
-            "emojis": emojis,
-            "reply_cnt": reply_cnt,
-            "retweet_cnt": retweet_cnt,
-            "like_cnt": like_cnt,
-            "image_links": image_links,
-            "tweet_url": tweet_url
-        }
-
-        return tweet
+        return extract_tweet(post_soup)
 
     def get_follows(self, **scrape_kwargs):
         return asyncio.run(self.aget_follows(**scrape_kwargs))
@@ -425,13 +376,16 @@ class Scweet:
                 return {}
         tab = await self.driver.get(f"https://x.com/{handle}/{type}")
         await tab.sleep(sleep)
+        # `sleep` bounds each wait, which returns as soon as the next cells rendered
+        waiter = ScrollWaiter(tab, max_timeout=sleep)
+        await waiter.install()
+        step = StepController(self.scroll_ratio) if self.adaptive_scroll else None
 
         num_scrolls = 0
         follow_ids = set()
-        previous_len = 0
         while True:
-            await tab.scroll_down(self.scroll_ratio)
-            await tab.sleep(sleep)
+            await tab.scroll_down(step.ratio if step else self.scroll_ratio)
+            await waiter.wait()
             # count the number of li elements if they keep increase
             html_el = await tab.get_content()
             if 'Your account is suspended' in html_el:
@@ -442,18 +396,26 @@ class Scweet:
                 return list(follow_ids)
             soup = BeautifulSoup(html_el, 'html.parser')
             page_cards = soup.select('button[data-testid*="UserCell"]')
+            visible_handles = []
             for card in page_cards:
                 card_text = card.get_text(separator=' ', strip=True)
                 match = re.search(r'(@\w+)', card_text)
                 if match:
                     username = match.group(1)
+                    visible_handles.append(username)
                     if username not in follow_ids:
                         follow_ids.add(username)
-            if len(follow_ids) == previous_len:
-                break
-            previous_len = len(follow_ids)
+            if step:
+                step.update(visible_handles)
             num_scrolls += 1
             logging.info(f"Fetched {len(follow_ids)} in scroll {num_scrolls}")
+            # a scroll may bring no new handle while the list is still loading
+            if waiter.stalled:
+                logging.info(f"No more {type} for {handle}")
+                break
+            if self.max_scrolls and num_scrolls >= self.max_scrolls:
+                logging.info(f"Reached {self.max_scrolls} scrolls for {handle}")
+                break
 
         if not stay_logged_in:
             await self.close()
@@ -461,72 +423,173 @@ class Scweet:
 
 
 
-    async def consume_html(self, html_queue, index, all_posts_data):
+    async def consume_html(self, html_queue, index, all_posts_data, on_tweet=None, new_ids=None):
         """
         This coroutine runs concurrently with the main fetch loop.
         It consumes HTML from the queue and updates all_posts_data.
         """
         while True:
             html_el = await html_queue.get()
-            await self.aget_data(html_el, index, all_posts_data)
+            await self.aget_data(html_el, index, all_posts_data, on_tweet, new_ids)
             html_queue.task_done()
 
-    async def aget_data(self, html_content, index, all_posts_data):
-        data_file_name = f"data_{index}.json"
-        soup = BeautifulSoup(html_content, 'html.parser')
-        posts = soup.select('article[data-testid=tweet]')
-        for post_soup in posts:
-            data = await self.get_data(post_soup)
-            if data:
-                # Use the tweet_url as key
-                tweet_id = data['tweet_url'].split("/")[-1]
-                if tweet_id not in all_posts_data:
-                    all_posts_data[tweet_id] = data
-                    # Instead of continually reading and writing data.json, we write a separate file per task:
-                    with open(data_file_name, "w") as f:
-                        json.dump(all_posts_data, f)
-        logging.info(f"[tab {index}] Extracted {len(all_posts_data)} tweets in total")
+    async def aget_data(self, html_content, index, all_posts_data, on_tweet=None, new_ids=None):
+        # Only articles with an unseen status id go through the full field extraction
+        if self.parse_executor:
+            # filter here so that only the new articles are sent to the worker processes
+            articles = [article_html for tweet_id, article_html in iter_tweet_articles(html_content)
+                        if tweet_id not in all_posts_data]
+            if not articles:
+                return all_posts_data
+            loop = asyncio.get_running_loop()
+            records = await loop.run_in_executor(self.parse_executor, parse_articles,
+                                                 articles, self.parser.name)
+        else:
+            records = parse_tweets(html_content, all_posts_data, self.parser.name)
+        return self.store_tweets(records, index, all_posts_data, on_tweet, new_ids)
+
+    def store_tweets(self, records, index, all_posts_data, on_tweet=None, new_ids=None):
+        """
+        Merge new (tweet_id, tweet) records into all_posts_data. With on_tweet, each new
+        tweet is handed over right away and all_posts_data only remembers its id. The
+        ids of new tweets are also appended to `new_ids`, if given.
+        """
+        new_tweets = 0
+        for tweet_id, data in records:
+            if tweet_id not in all_posts_data:
+                all_posts_data[tweet_id] = None if on_tweet else data
+                new_tweets += 1
+                if new_ids is not None:
+                    new_ids.append(tweet_id)
+                if on_tweet:
+                    on_tweet(tweet_id, data)
+        logging.info(f"[tab {index}] Extracted {len(all_posts_data)} tweets in total ({new_tweets} new)")
+        return all_posts_data
+
+    async def fetch_tweets(self, url, index, limit, on_tweet=None, status=None, budget=None):
+        tab = await self.tab_pool.acquire()
+        capture = TimelineCapture(tab) if self.extraction == "network" else None
+        discard = True
+        try:
+            # listen before navigating so the first timeline response is captured too
+            if capture:
+                await capture.start()
+            await self.tab_pool.navigate(tab, url)
+            all_posts_data = await self.scroll_tweets(tab, index, limit, on_tweet, capture, status, budget)
+            discard = False
+        finally:
+            if capture:
+                await capture.stop()
+            await self.tab_pool.release(tab, discard=discard)
         return all_posts_data
 
-    async def fetch_tweets(self, url, index, limit):
-        tab = await self.driver.get(url, new_tab=True)
-        if await check_element_if_exists_by_text(tab, "Retry"):
+    async def scroll_tweets(self, tab, index, limit, on_tweet=None, capture=None, status=None, budget=None):
+        """
+        Scroll the search timeline of `tab` until it ends, stalls or fails, or until the
+        TweetBudget shared with the other tabs is spent. If given, the `status` dict receives
+        why scrolling stopped ("reason"), the number of scrolls and the number of unique tweets found.
+        """
+        if self.extraction == "js":
+            await reset_page_extractor(tab)
+        if await get_page_state(tab) == "retry":
             retry = await tab.find('Retry')
             await retry.click()
             await tab.sleep(3)
 
+        waiter = ScrollWaiter(tab)
+        await waiter.install()
+        step = StepController(self.scroll_ratio) if self.adaptive_scroll else None
         await tab.scroll_down(self.scroll_ratio//2)
-        await tab.sleep(2)
+        await waiter.wait()
 
         num_scrolls = 0
+        num_retries = 0
         all_posts_data = {}
-        last_len = 0
-        html_queue = asyncio.Queue()
-        consumer_task = asyncio.create_task(self.consume_html(html_queue, index, all_posts_data))
+        reason = None
+        # ids recorded since the last prune
+        unpruned_ids = [] if self.prune_dom else None
+        num_pruned = 0
+        scroll_time = 0.0
+        html_queue = SnapshotQueue(seen=all_posts_data)
+        consumer_task = asyncio.create_task(self.consume_html(html_queue, index, all_posts_data, on_tweet,
+                                                              unpruned_ids))
 
         while True:
+            self.last_activity = time.monotonic()
+            if budget is not None and budget.exhausted.is_set():
+                logging.info(f"Tweet budget spent, stopping tab index {index}")
+                reason = "limit"
+                break
+            scroll_start = time.perf_counter()
             await tab.activate()
-            await tab.scroll_down(self.scroll_ratio)
-            await tab.sleep(0.5)
-            html_el = await tab.get_content()
-            # Put the HTML in the queue for processing by the consumer
-            await html_queue.put(html_el)
+            await tab.scroll_down(step.ratio if step else self.scroll_ratio)
+            await waiter.wait()
+            visible_ids = None
+            if capture:
+                self.store_tweets(capture.drain(), index, all_posts_data, on_tweet, unpruned_ids)
+            elif self.extraction == "js":
+                records = await extract_tweets_in_page(tab)
+                self.store_tweets(records, index, all_posts_data, on_tweet, unpruned_ids)
+            else:
+                html_el = await tab.get_content()
+                visible_ids = [tweet_id for tweet_id, _ in iter_tweet_articles(html_el)]
+                # Put the HTML in the queue for processing by the consumer; waits while it is full
+                await html_queue.put(html_el, visible_ids)
+            if step:
+                step.update(visible_ids if visible_ids is not None else await get_visible_tweet_ids(tab))
+            if self.prune_dom:
+                recorded = list(unpruned_ids)
+                unpruned_ids.clear()
+                num_pruned += await prune_articles(tab, recorded)
             num_scrolls += 1
 
-            if await check_element_if_exists_by_text(tab, "Something went wrong. Try reloading."):
+            page_state = await get_page_state(tab)
+            scroll_time += time.perf_counter() - scroll_start
+            if capture and capture.exhausted:
+                logging.info(f"Timeline cursor exhausted for tab index {index}")
+                reason = "exhausted"
+                break
+            elif page_state == "rate_limited":
                 logging.info(f"Something went wrong (rate limit) for tab index {index}")
+                reason = "rate_limited"
+                break
+            elif page_state == "suspended":
+                logging.info(f"Account suspended. Use another one.")
+                self.suspended = True
+                reason = "suspended"
+                break
+            elif page_state == "end":
+                logging.info(f"No results for tab index {index}")
+                reason = "end"
                 break
-            elif num_scrolls%5 == 0:
-                current_len = len(all_posts_data)
-                if current_len == last_len:
-                    logging.info(f"No more tweets for tab index {index}")
+            elif page_state == "retry":
+                num_retries += 1
+                if num_retries > self.max_retries:
+                    logging.info(f"Retry didn't clear after {self.max_retries} clicks for tab index {index}")
+                    reason = "retry_failed"
                     break
-                last_len = current_len
+                retry = await tab.find('Retry')
+                await retry.click()
+                await tab.sleep(3)
+            elif waiter.stalled:
+                logging.info(f"No more tweets for tab index {index}")
+                reason = "no_new_tweets"
+                break
             elif len(all_posts_data)>limit:
                 logging.info("Reached desired tweets count.")
+                reason = "limit"
+                break
+            if page_state != "retry":
+                num_retries = 0
+            if self.max_scrolls and num_scrolls >= self.max_scrolls:
+                logging.info(f"Reached {self.max_scrolls} scrolls for tab index {index}")
+                reason = "max_scrolls"
                 break
 
         # Done producing, now wait for the consumer to finish processing all queued HTML
+        if capture:
+            await capture.settle()
+            self.store_tweets(capture.drain(), index, all_posts_data, on_tweet)
         await html_queue.join()
         # Cancel the consumer task if it's still running
         consumer_task.cancel()
@@ -535,11 +598,17 @@ class Scweet:
         except asyncio.CancelledError:
             pass
 
-        await tab.sleep(1)
-        await tab.close()
-
-        logging.info(f"Scrolling ended after {num_scrolls} scrolls")
+        logging.info(f"Scrolling ended after {num_scrolls} scrolls "
+                     f"({scroll_time / max(num_scrolls, 1):.2f}s per scroll)")
+        if step:
+            logging.info(f"Scroll step settled at {step.ratio} after {step.gaps} gaps")
+        if num_pruned:
+            logging.info(f"{num_pruned} extracted articles pruned from the page for tab index {index}")
+        if html_queue.dropped:
+            logging.info(f"{html_queue.dropped} superseded snapshots skipped for tab index {index}")
         logging.info(f"{len(all_posts_data)} unique tweets found after scrolling")
+        if status is not None:
+            status.update(reason=reason, scrolls=num_scrolls, tweets=len(all_posts_data))
 
         return all_posts_data
 
@@ -570,15 +639,93 @@ class Scweet:
             minreplies=None,
             minlikes=None,
             minretweets=None,
-            custom_csv_name=None
+            custom_csv_name=None,
+            keep_results: bool = True,
+            output_format: str = "csv",
+            adaptive: bool = False,
+            saturation_tweets: int = 2000,
+            sparse_tweets: int = 100
     ):
         """
-        Scrape tweets between [since, until] using concurrency, writing incrementally to CSV.
-        If resume=True and a CSV file with the same name exists, we read its max 'Timestamp'
-        and override `since` if it is more recent.
+        Scrape tweets between [since, until] using concurrency, streaming each tweet to CSV
+        as soon as it is extracted. Finished intervals are recorded in <output>.intervals.json;
+        if resume=True only the intervals that are missing from it or failed are scraped again.
+        Outputs without that manifest resume from their max 'Timestamp' instead, overriding
+        `since` if it is more recent. Tweets already in the output (<output>.ids) are skipped.
+        With keep_results=False tweets are not kept in memory and an empty dict is returned.
+        output_format "parquet" writes a typed Parquet dataset directory instead of the CSV,
+        "sqlite" upserts into a SQLite database keyed by tweetId.
+        With adaptive=True, intervals reaching max_scrolls or saturation_tweets are split in half
+        and queued again, and the intervals following one under sparse_tweets may be merged.
         """
-        if not self.driver:
-            await self.init_nodriver()
+        job = self.prepare_scrape(
+            since=since, until=until, words=words, to_account=to_account, from_account=from_account,
+            mention_account=mention_account, lang=lang, limit=limit, display_type=display_type,
+            resume=resume, hashtag=hashtag, save_dir=save_dir, filter_replies=filter_replies,
+            proximity=proximity, geocode=geocode, minreplies=minreplies, minlikes=minlikes,
+            minretweets=minretweets, custom_csv_name=custom_csv_name, keep_results=keep_results,
+            output_format=output_format, adaptive=adaptive, saturation_tweets=saturation_tweets,
+            sparse_tweets=sparse_tweets
+        )
+        return (await self.run_scrape_jobs([job]))[0]
+
+    def batch_scrape(self, jobs):
+        """
+        Synchronously execute the asynchronous abatch_scrape method.
+        """
+        return asyncio.run(self.abatch_scrape(jobs))
+
+    async def abatch_scrape(self, jobs: List[dict]):
+        """
+        Scrape several searches (e.g. cities or date ranges) in one browser session. Each
+        item of `jobs` holds the keyword arguments of ascrape and gets its own output file,
+        manifest and limit, while the intervals of all of them are taken round-robin by the
+        same pool of `concurrency` tabs after a single login.
+        Returns {output path: tweets} (empty dicts with keep_results=False).
+        """
+        scrape_jobs = [self.prepare_scrape(**scrape_kwargs) for scrape_kwargs in jobs]
+        paths = [job.path for job in scrape_jobs]
+        if len(set(paths)) != len(paths):
+            raise ValueError("Each job must write to its own output file")
+        results = await self.run_scrape_jobs(scrape_jobs)
+        return dict(zip(paths, results))
+
+    def prepare_scrape(
+            self,
+            since: str,
+            until: str = None,
+            words: Union[str, list] = None,
+            to_account: str = None,
+            from_account: str = None,
+            mention_account: str = None,
+            lang: str = None,
+            limit: float = float("inf"),
+            display_type: str = "Top",
+            resume: bool = False,
+            hashtag: str = None,
+            save_dir: str = "outputs",
+            filter_replies: bool = False,
+            proximity: bool = False,
+            geocode: str = None,
+            minreplies=None,
+            minlikes=None,
+            minretweets=None,
+            custom_csv_name=None,
+            keep_results: bool = True,
+            output_format: str = "csv",
+            adaptive: bool = False,
+            saturation_tweets: int = 2000,
+            sparse_tweets: int = 100,
+            intervals: list = None
+    ):
+        """
+        Resolve the output file, the resume point and the intervals of one ascrape call,
+        returning the ScrapeJob that run_scrape_jobs scrapes. Takes the arguments of ascrape,
+        plus `intervals`: explicit (since, until) datetimes to scrape instead of splitting
+        [since, until] into n_splits, which then only name the output.
+        """
+        if output_format not in SINKS:
+            raise ValueError(f"output_format must be one of {set(SINKS)}")
 
         if not until:
             until = date.today().strftime("%Y-%m-%d")
@@ -592,27 +739,15 @@ class Scweet:
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
 
-        if words:
-            fname_part = '_'.join(words)
-        elif from_account:
-            fname_part = from_account
-        elif to_account:
-            fname_part = to_account
-        elif mention_account:
-            fname_part = mention_account
-        elif hashtag:
-            fname_part = hashtag
-        else:
-            fname_part = "tweets"
-
-        if not custom_csv_name:
-            csv_filename = f"{save_dir}/{fname_part}_{since}_{until}.csv"
-        else:
-            csv_filename = f'{save_dir}/{custom_csv_name}'
+        sink_class = SINKS[output_format]
+        csv_filename = output_path(save_dir, since, until, words=words, from_account=from_account,
+                                   to_account=to_account, mention_account=mention_account, hashtag=hashtag,
+                                   custom_csv_name=custom_csv_name, output_format=output_format)
 
-        # If resume is True and the CSV already exists, read the last date
-        if resume and os.path.exists(csv_filename):
-            last_date_str = self.get_last_date_from_csv(csv_filename)
+        # If resume is True and the CSV already exists without an interval manifest, read the last date
+        manifest_path = f"{csv_filename}.intervals.json"
+        if resume and os.path.exists(csv_filename) and not os.path.exists(manifest_path):
+            last_date_str = sink_class.last_timestamp(csv_filename)
             if last_date_str:
                 try:
                     # parse the CSV's last date (which we store as ISO8601 w/ 'T' but might have .000Z)
@@ -630,157 +765,122 @@ class Scweet:
                     logging.info(f"Could not parse last date from CSV: {e}")
                     # keep the original since
 
-        # 2) Prepare the CSV header
+        # 2) Split [since, until] into intervals, each searched by its own url (see build_search_url)
         # -----------------------------------------
-        header = [
-            "tweetId", "UserScreenName", "UserName", "Timestamp", "Text",
-            "Embedded_text", "Emojis", "Comments", "Likes",
-            "Retweets", "Image link", "Tweet URL"
-        ]
-
-        # 3) Build all URLs (using your own build_search_url)
+        def build_url(interval_since, interval_until):
+            return self.build_search_url(
+                since=interval_since,
+                until=interval_until,
+                lang=lang,
+                display_type=display_type,
+                words=words,
+                to_account=to_account,
+                from_account=from_account,
+                mention_account=mention_account,
+                hashtag=hashtag,
+                filter_replies=filter_replies,
+                proximity=proximity,
+                geocode=geocode,
+                minreplies=minreplies,
+                minlikes=minlikes,
+                minretweets=minretweets,
+                n=1
+            )[0]
+
+        if intervals is None:
+            intervals = split_intervals(datetime.strptime(since, "%Y-%m-%d"), datetime.strptime(until, "%Y-%m-%d"),
+                                        self.n_splits)
+        logging.info(f"{len(intervals)} intervals generated for {csv_filename}")
+
+        # 3) Figure out write mode for the output and the intervals left to scrape
         # -----------------------------------------
-        urls = self.build_search_url(
-            since=since,
-            until=until,
-            lang=lang,
-            display_type=display_type,
-            words=words,
-            to_account=to_account,
-            from_account=from_account,
-            mention_account=mention_account,
-            hashtag=hashtag,
-            filter_replies=filter_replies,
-            proximity=proximity,
-            geocode=geocode,
-            minreplies=minreplies,
-            minlikes=minlikes,
-            minretweets=minretweets,
-            n=self.n_splits
-        )
-
-        logging.info(f"{len(urls)} urls generated")
+        append = resume and os.path.exists(csv_filename)
+        return ScrapeJob(os.path.basename(csv_filename), csv_filename, sink_class, intervals, build_url,
+                         append=append, limit=limit, keep_results=keep_results, adaptive=adaptive,
+                         saturation_tweets=saturation_tweets, sparse_tweets=sparse_tweets)
 
-        # 4) Figure out write mode for CSV
-        # -----------------------------------------
-        write_mode = "a" if (resume and os.path.exists(csv_filename)) else "w"
-        total_tweets = 0
-        all_data = {}
+    async def run_scrape_jobs(self, jobs: List[ScrapeJob], stay_logged_in=False):
+        """
+        Scrape prepared jobs with one login and one pool of tab workers, each worker taking
+        the next interval of any job as soon as it is free. Returns the tweets of each job.
+        With stay_logged_in, the browser is left open for the caller's next jobs.
+        """
+        if not self.driver:
+            await self.init_nodriver()
 
-        # 5) Open the CSV file
-        # -----------------------------------------
-        with open(csv_filename, write_mode, newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if write_mode == "w":
-                writer.writerow(header)
+        # tasks of the caller, which the cleanup below must leave alone
+        caller_tasks = asyncio.all_tasks()
+        opened = []
+        try:
+            # 4) Open the output sinks
+            # -----------------------------------------
+            for job in jobs:
+                job.open()
+                opened.append(job)
 
-            # 6) Initialize driver + optional login
+            # 5) Initialize driver + optional login
             # -----------------------------------------
             main_tab, logged_in, reason, new_cookies = await self.login()
             if not logged_in:
                 logging.info(f"Couldn't login due to {reason}")
-                return {}
+                return [{} for _ in jobs]
 
-            # 7) Concurrency loop: fetch each chunk
+            # 6) Worker pool: each tab pulls the next interval of any job as soon as it is free
             # -----------------------------------------
-            for i in range(0, len(urls), self.concurrency):
-                chunk = urls[i: i + self.concurrency]
-                logging.info(f"Processing chunk with {len(chunk)} urls")
-                tasks = [
-                    asyncio.create_task(self.fetch_tweets(url, index=i + j, limit=limit))
-                    for j, url in enumerate(chunk)
-                ]
-                results_list = await asyncio.gather(*tasks)
-
-                # Write each tweet row to CSV
-                for result_dict in results_list:
-                    all_data.update(result_dict)
-                    for tweet_id, tweet_data in result_dict.items():
-                        row = [
-                            tweet_id,
-                            tweet_data.get("handle", ""),  # "UserScreenName"
-                            tweet_data.get("username", ""),  # "UserName"
-                            tweet_data.get("postdate", ""),  # "Timestamp"
-                            tweet_data.get("text", ""),  # "Text"
-                            tweet_data.get("embedded", ""),  # "Embedded_text"
-                            tweet_data.get("emojis", ""),  # "Emojis"
-                            tweet_data.get("reply_cnt", "0"),  # "Comments"
-                            tweet_data.get("like_cnt", "0"),  # "Likes"
-                            tweet_data.get("retweet_cnt", "0"),  # "Retweets"
-                            " ".join(tweet_data.get("image_links", [])),  # "Image link"
-                            tweet_data.get("tweet_url", ""),  # "Tweet URL"
-                        ]
-                        writer.writerow(row)
-                        total_tweets += 1
-
-                        if total_tweets >= limit:
-                            logging.info(f"Reached limit of {limit} tweets. Stopping early.")
-                            break
-                    if total_tweets >= limit:
-                        break
-                if total_tweets >= limit:
-                    break
-
-            # 8) Done scraping
+            planners = PlannerGroup(job.planner for job in jobs)
+
+            async def worker():
+                while True:
+                    task = await planners.get()
+                    if task is None:
+                        return
+                    position, (index, url, interval) = task
+                    job = jobs[position]
+                    journal = job.start_interval(index)
+                    status = {}
+                    try:
+                        await self.fetch_tweets(url, index=index, limit=job.limit,
+                                                on_tweet=functools.partial(job.write_tweet, journal),
+                                                status=status, budget=job.budget)
+                    except Exception as e:
+                        logging.info(f"[tab {index}] Failed to fetch tweets: {e}")
+                        status["reason"] = "error"
+                    await job.finish_interval(journal, url, interval, status)
+                    logging.info(f"[tab {index}] Interval of {job.name} done, "
+                                 f"{len(job.planner.pending)} intervals left")
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            await asyncio.gather(*workers)
+
+            # 7) Done scraping
             # -----------------------------------------
-            logging.info(f"Scraping completed. Total tweets written: {total_tweets}")
+            logging.info(f"Scraping completed. Total tweets written: {sum(job.budget.used for job in jobs)}")
 
-            # Cancel any lingering tasks before shutting down.
-            pending_tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            # Cancel any lingering tasks of this run before shutting down.
+            pending_tasks = [t for t in asyncio.all_tasks() - caller_tasks if t is not asyncio.current_task()]
             for task in pending_tasks:
                 task.cancel()
             await asyncio.gather(*pending_tasks, return_exceptions=True)
 
             # close driver if needed
-            await self.close()
+            if not stay_logged_in:
+                await self.close()
+        finally:
+            for job in opened:
+                job.close()
 
-        return all_data
+        return [job.all_data for job in jobs]
 
     def get_last_date_from_csv(self, path):
         """
-        Reads the CSV file line-by-line to find the max 'Timestamp'.
-        Returns the max date as a string in '%Y-%m-%dT%H:%M:%S.000Z' format or None.
+        Returns the max 'Timestamp' of the CSV as a string in '%Y-%m-%dT%H:%M:%S.000Z'
+        format or None, from its sidecar manifest or by reading the file backwards.
         """
-        max_dt = None
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                reader = csv.reader(f)
-                # First row: header
-                header = next(reader, None)
-                if not header or "Timestamp" not in header:
-                    return None
-                ts_idx = header.index("Timestamp")
-
-                # Read each row
-                for row in reader:
-                    if len(row) <= ts_idx:
-                        continue
-                    timestamp_str = row[ts_idx].strip()
-                    if not timestamp_str:
-                        continue
-
-                    # Attempt to parse. If your CSV uses an exact known format,
-                    # call datetime.strptime(timestamp_str, "<your_format>")
-                    # For example, if you store it as 2025-01-21T18:34:59.000Z:
-                    try:
-                        # remove trailing 'Z' to parse with fromisoformat in Python 3.11+
-                        dt = datetime.fromisoformat(timestamp_str.replace('Z', ''))
-                    except:
-                        # fallback formats, or skip
-                        dt = None
-
-                    if dt and (max_dt is None or dt > max_dt):
-                        max_dt = dt
-        except:
-            return None
-
-        if max_dt:
-            return max_dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        return None
+        return CsvSink.last_timestamp(path)
 
     def build_search_url(self,
-                         since: str,
-                         until: str,
+                         since: Union[str, datetime],
+                         until: Union[str, datetime],
                          lang: str = None,
                          display_type: str = "Top",
                          words: Union[str, list] = None,
@@ -796,27 +896,20 @@ class Scweet:
                          minretweets: int = None,
                          n: int = 10
                          ) -> List[str]:
+        """
+        One search url per interval of [since, until] split in n (n=-1: one per day). Bounds are
+        '%Y-%m-%d' strings or datetimes. Intervals shorter than a day, or not starting and
+        ending at midnight, are bounded by since_id/max_id derived from snowflake timestamps
+        instead of the day-granular since:/until: operators. Identical urls are collapsed.
+        """
 
         display_type_allowed = {"Top", "Recent", "latest", "image"}
         if display_type not in display_type_allowed:
             raise ValueError(f"display_type must be one of {display_type_allowed}")
 
         # Convert `since` and `until` to datetime
-        since_dt = datetime.strptime(since, "%Y-%m-%d")
-        until_dt = datetime.strptime(until, "%Y-%m-%d")
-
-        # Edge case: if since_dt >= until_dt, just return one interval
-        total_days = (until_dt - since_dt).days
-        if total_days < 1:
-            total_days = 1
-
-        # Set interval based on n.
-        # If n == -1, split by day so that n becomes the number of days.
-        if n == -1:
-            n = total_days
-            interval = 1  # interval in days
-        else:
-            interval = total_days / n
+        since_dt = since if isinstance(since, datetime) else datetime.strptime(since, "%Y-%m-%d")
+        until_dt = until if isinstance(until, datetime) else datetime.strptime(until, "%Y-%m-%d")
 
         # Prepare account/hashtag strings
         from_str = f"(from%3A{from_account})%20" if from_account else ""
@@ -866,16 +959,8 @@ class Scweet:
 
         # Build intervals
         urls = []
-        for i in range(n):
-            current_since = since_dt + timedelta(days=i * interval)
-            current_until = since_dt + timedelta(days=(i + 1) * interval)
-
-            # Cap current_until at the final date
-            if current_until > until_dt:
-                current_until = until_dt
-
-            since_part = f"since%3A{current_since.strftime('%Y-%m-%d')}%20"
-            until_part = f"until%3A{current_until.strftime('%Y-%m-%d')}%20"
+        for current_since, current_until in split_intervals(since_dt, until_dt, n):
+            since_part, until_part = interval_query(current_since, current_until)
 
             # Build final path
             path = (
@@ -898,11 +983,8 @@ class Scweet:
                     + proximity_str
             )
 
-            urls.append(path)
-
-            # If we've reached or passed the final date, stop early
-            if current_until >= until_dt:
-                break
+            if path not in urls:
+                urls.append(path)
 
         return urls
 
@@ -925,91 +1007,30 @@ class Scweet:
           - join_date
           - description
         """
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # Extract following using the element that shows following count.
-        try:
-            # This selector finds an <a> whose href contains "/following", then finds a nested span with text.
-            following_elem = soup.select_one('a[href*="/following"] span span')
-            following = following_elem.get_text(strip=True) if following_elem else None
-            if following:
-                following = parse_followers(following)
-        except Exception:
-            following = None
-
-        # Extract verified followers from the corresponding element.
-        try:
-            verified_elem = soup.select_one('a[href*="/verified_followers"] span span')
-            verified_followers = verified_elem.get_text(strip=True) if verified_elem else None
-            if verified_followers:
-                verified_followers = parse_followers(verified_followers)
-        except Exception:
-            verified_followers = None
-
-        # Extract username (display name) from the element with data-testid="UserName".
-        try:
-            username_elem = soup.select_one('div[data-testid="UserName"] span')
-            username = username_elem.get_text(strip=True) if username_elem else None
-        except Exception:
-            username = None
-
-        # Extract location using the element with data-testid "UserLocation".
-        try:
-            location_elem = soup.select_one('span[data-testid="UserLocation"] span')
-            location = location_elem.get_text(strip=True) if location_elem else ""
-        except Exception:
-            location = ""
-
-        # Extract website using the element with data-testid "UserUrl"; we use the href attribute.
-        try:
-            website_elem = soup.select_one('a[data-testid="UserUrl"]')
-            website = website_elem.get("href", "") if website_elem else ""
-        except Exception:
-            website = ""
-
-        # Extract join date using the element with data-testid "UserJoinDate".
-        try:
-            join_date_elem = soup.select_one('span[data-testid="UserJoinDate"] span')
-            join_date = join_date_elem.get_text(strip=True) if join_date_elem else ""
-        except Exception:
-            join_date = ""
-
-        # Extract profile description from the element with data-testid "UserDescription".
-        try:
-            desc_elem = soup.select_one('div[data-testid="UserDescription"]')
-            desc = desc_elem.get_text(strip=True) if desc_elem else ""
-        except Exception:
-            desc = ""
-
-        # Build the profile dictionary.
-        profile = {
-            "username": username,
-            "following": following,
-            "verified_followers": verified_followers,
-            "location": location,
-            "website": website,
-            "join_date": join_date,
-            "description": desc
-        }
-        all_infos[handle] = profile
+        all_infos[handle] = self.parser.parse_profile(html)
         return all_infos
 
     async def process_handles_chunk(self, handles_chunk):
-        tab = await self.driver.get("https://x.com", new_tab=True)
         all_infos = {}
         profiles_queue = asyncio.Queue()
         consumer_task = asyncio.create_task(self.consume_profile(profiles_queue, all_infos))
         for handle in handles_chunk:
+            # one pool use per profile, so max_uses and the heap check apply between profiles too
+            tab = await self.tab_pool.acquire()
+            discard = True
             try:
                 await tab.activate()
-                await tab.get(f"https://x.com/{handle}")
+                await self.tab_pool.navigate(tab, f"https://x.com/{handle}")
                 await tab.sleep(4)
                 await tab.activate()
                 html_el = await tab.get_content()
+                discard = False
                 # Put the HTML in the queue for processing by the consumer
                 await profiles_queue.put((handle, html_el))
             except Exception as e:
                 pass
+            finally:
+                await self.tab_pool.release(tab, discard=discard)
 
         await profiles_queue.join()
         consumer_task.cancel()
@@ -1018,7 +1039,6 @@ class Scweet:
         except asyncio.CancelledError:
             pass
 
-        await tab.close()
         return all_infos
 
     def get_user_information(self, **profiles_kwargs):
@@ -1056,12 +1076,20 @@ class Scweet:
         return consolidated_results
 
     async def close(self):
+        if self.parse_executor:
+            self.parse_executor.shutdown(cancel_futures=True)
+            self.parse_executor = None
+        if self.tab_pool:
+            await self.tab_pool.close()
+            self.tab_pool = None
         if self.display:
             logging.info("Stopping virtual display")
             self.display.stop()
         if self.driver:
             self.driver.stop()
             self.driver = None
+            # the session ends with the browser
+            self.logged_in = False
 
     async def __aenter__(self):
         await self.init_nodriver()
@@ -0,0 +1,561 @@
+"""
+Output sinks that scraped tweets are streamed into as soon as they are extracted.
+"""
+
+import csv
+import glob
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CSV_HEADER = [
+    "tweetId", "UserScreenName", "UserName", "Timestamp", "Text",
+    "Embedded_text", "Emojis", "Comments", "Likes",
+    "Retweets", "Image link", "Tweet URL"
+]
+
+
+def tweet_to_row(tweet_id, tweet_data):
+    return [
+        tweet_id,
+        tweet_data.get("handle", ""),  # "UserScreenName"
+        tweet_data.get("username", ""),  # "UserName"
+        tweet_data.get("postdate", ""),  # "Timestamp"
+        tweet_data.get("text", ""),  # "Text"
+        tweet_data.get("embedded", ""),  # "Embedded_text"
+        tweet_data.get("emojis", ""),  # "Emojis"
+        tweet_data.get("reply_cnt", "0"),  # "Comments"
+        tweet_data.get("like_cnt", "0"),  # "Likes"
+        tweet_data.get("retweet_cnt", "0"),  # "Retweets"
+        " ".join(tweet_data.get("image_links", [])),  # "Image link"
+        tweet_data.get("tweet_url", ""),  # "Tweet URL"
+    ]
+
+
+def row_to_tweet(row):
+    """Inverse of tweet_to_row, for rows read back from any output format."""
+    (tweet_id, handle, username, postdate, text, embedded, emojis,
+     reply_cnt, like_cnt, retweet_cnt, image_links, tweet_url) = row
+    if isinstance(postdate, datetime):
+        postdate = postdate.strftime('%Y-%m-%dT%H:%M:%S.') + f"{postdate.microsecond // 1000:03d}Z"
+    if isinstance(image_links, str):
+        image_links = image_links.split()
+    return str(tweet_id), {
+        "handle": handle or "",
+        "username": username or "",
+        "postdate": postdate or "",
+        "text": text or "",
+        "embedded": embedded or "",
+        "emojis": emojis or "",
+        "reply_cnt": "" if reply_cnt is None else str(reply_cnt),
+        "like_cnt": "" if like_cnt is None else str(like_cnt),
+        "retweet_cnt": "" if retweet_cnt is None else str(retweet_cnt),
+        "image_links": list(image_links or []),
+        "tweet_url": tweet_url or "",
+    }
+
+
+def output_path(save_dir, since, until, words=None, from_account=None, to_account=None,
+                mention_account=None, hashtag=None, custom_csv_name=None, output_format="csv"):
+    """The output file (or Parquet directory) ascrape writes a search to."""
+    if words:
+        fname_part = '_'.join(words)
+    elif from_account:
+        fname_part = from_account
+    elif to_account:
+        fname_part = to_account
+    elif mention_account:
+        fname_part = mention_account
+    elif hashtag:
+        fname_part = hashtag
+    else:
+        fname_part = "tweets"
+
+    if not custom_csv_name:
+        path = f"{save_dir}/{fname_part}_{since}_{until}.csv"
+    else:
+        path = f'{save_dir}/{custom_csv_name}'
+    if output_format != "csv":
+        path = os.path.splitext(path)[0] + SINKS[output_format].extension
+    return path
+
+
+# a CSV row starts with the numeric tweetId column
+CSV_ROW_START_RE = re.compile(rb"\n(?=\d+,)")
+
+
+def manifest_path(path):
+    return path + ".meta.json"
+
+
+def _update_bounds(stats, timestamp):
+    if not timestamp:
+        return
+    # every Timestamp has the same ISO 8601 format, so strings compare like dates
+    if stats["rows"] is None:
+        # stats guessed from the newest rows: the min is unknown and stays so, and an
+        # unknown max could be below the one of the unread rows
+        if stats["max_timestamp"] is not None and timestamp > stats["max_timestamp"]:
+            stats["max_timestamp"] = timestamp
+        return
+    if stats["max_timestamp"] is None or timestamp > stats["max_timestamp"]:
+        stats["max_timestamp"] = timestamp
+    if stats["min_timestamp"] is None or timestamp < stats["min_timestamp"]:
+        stats["min_timestamp"] = timestamp
+
+
+def _csv_rows(data, n_columns, torn_tail=False):
+    """
+    Parse decoded CSV rows, or None if any of them doesn't have `n_columns` fields.
+    With torn_tail, a short last row, cut off by a killed run, is dropped instead.
+    """
+    try:
+        rows = list(csv.reader(io.StringIO(data)))
+    except csv.Error:
+        return None
+    if torn_tail and rows and len(rows[-1]) < n_columns:
+        rows.pop()
+    if any(len(row) != n_columns for row in rows):
+        return None
+    return rows
+
+
+def _read_header(f):
+    f.seek(0)
+    header = next(csv.reader([f.readline().decode("utf-8")]), [])
+    if "Timestamp" not in header:
+        return None, None
+    return header, header.index("Timestamp")
+
+
+def _tail_max_timestamp(path, block_size=65536, max_bytes=1 << 20):
+    """
+    Max Timestamp of the newest rows, read backwards in blocks until the rows after
+    a block's first candidate row start all parse. Quoted fields may span lines, so
+    a candidate is rejected when anything after it doesn't parse into full rows; a
+    short last row, torn by a killed run, is ignored. Each block is parsed once and
+    the scan gives up after the last `max_bytes`.
+    """
+    with open(path, "rb") as f:
+        header, ts_idx = _read_header(f)
+        if header is None:
+            return None
+        rows_start = f.tell()
+        pos = f.seek(0, os.SEEK_END)
+        scan_start = max(rows_start, pos - max_bytes)
+        tail = b""
+        while pos > scan_start:
+            step = min(block_size, pos - scan_start)
+            pos -= step
+            f.seek(pos)
+            block = f.read(step)
+            tail = block + tail
+            if pos == rows_start:
+                start = 0
+            else:
+                match = CSV_ROW_START_RE.search(tail)
+                if match is None or match.start() >= len(block):
+                    # no row starts in this block, its rows continue further back
+                    continue
+                start = match.end()
+            rows = _csv_rows(tail[start:].decode("utf-8", errors="replace"), len(header), torn_tail=True)
+            timestamps = [row[ts_idx].strip() for row in rows or [] if row[ts_idx].strip()]
+            if timestamps:
+                return max(timestamps)
+    return None
+
+
+def read_csv_stats(path):
+    """
+    Row count, min/max Timestamp and byte size of a CSV written by CsvSink. The
+    sidecar manifest is trusted up to its byte offset and only rows appended after
+    it are parsed. Without a usable manifest, the max Timestamp comes from the
+    newest rows and the row count and min Timestamp are unknown (None).
+    """
+    size = os.path.getsize(path)
+    try:
+        with open(manifest_path(path), "r", encoding="utf-8") as f:
+            stats = json.load(f)
+        offset = stats["bytes"]
+    except (OSError, ValueError, KeyError, TypeError):
+        stats, offset = None, None
+    if stats is not None and offset <= size:
+        if offset < size:
+            # rows flushed after the manifest was last written
+            with open(path, "rb") as f:
+                header, ts_idx = _read_header(f)
+                f.seek(max(offset, f.tell()))
+                data = f.read().decode("utf-8", errors="replace")
+                rows = _csv_rows(data, len(header), torn_tail=True) if header else None
+            if rows is None:
+                stats = None
+            else:
+                for row in rows:
+                    _update_bounds(stats, row[ts_idx].strip())
+                if stats["rows"] is not None:
+                    stats["rows"] += len(rows)
+        if stats is not None:
+            stats["bytes"] = size
+            return stats
+    return {"rows": None, "min_timestamp": None, "max_timestamp": _tail_max_timestamp(path), "bytes": size}
+
+
+class CsvSink:
+    """
+    Buffers at most `flush_every` rows (or `flush_interval` seconds) before writing
+    them to the CSV and fsyncing. `on_flush` callbacks run after every durable flush.
+    A sidecar manifest (<path>.meta.json) keeps the row count, min/max Timestamp and
+    the byte offset of the last flush, so resuming doesn't have to scan the file.
+    """
+    extension = ".csv"
+    upserts = False
+
+    def __init__(self, path, append=False, flush_every=500, flush_interval=10.0, on_flush=None):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.rows_written = 0
+        append = append and os.path.exists(path)
+        if append:
+            self.stats = read_csv_stats(path)
+        else:
+            # the manifest of the file replaced here would be trusted until the first flush
+            if os.path.exists(manifest_path(path)):
+                os.remove(manifest_path(path))
+            self.stats = {"rows": 0, "min_timestamp": None, "max_timestamp": None, "bytes": 0}
+        self._file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if not append:
+            self._writer.writerow(CSV_HEADER)
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, tweet_id, tweet_data):
+        self._buffer.append(tweet_to_row(tweet_id, tweet_data))
+        _update_bounds(self.stats, tweet_data.get("postdate", ""))
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._writer.writerows(self._buffer)
+        self.rows_written += len(self._buffer)
+        if self.stats["rows"] is not None:
+            self.stats["rows"] += len(self._buffer)
+        self._buffer = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.stats["bytes"] = self._file.tell()
+        self.write_manifest()
+        self._last_flush = time.monotonic()
+        if self.on_flush:
+            self.on_flush()
+
+    def write_manifest(self):
+        tmp_path = manifest_path(self.path) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.stats, f)
+        os.replace(tmp_path, manifest_path(self.path))
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+            logging.info(f"{self.rows_written} rows written to {self.path}")
+
+    @staticmethod
+    def last_timestamp(path):
+        """Max Timestamp of the CSV in '%Y-%m-%dT%H:%M:%S.000Z' format, or None."""
+        try:
+            return read_csv_stats(path)["max_timestamp"]
+        except (OSError, UnicodeDecodeError, csv.Error):
+            return None
+
+    @staticmethod
+    def iter_ids(path):
+        """Every tweetId of the CSV, in file order."""
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            for row in reader:
+                if len(row) == len(header):
+                    yield row[0]
+
+    @staticmethod
+    def iter_tweets(path):
+        """Every (tweet_id, tweet_data) of the CSV, in file order."""
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) == len(CSV_HEADER):
+                    yield row_to_tweet(row)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_timestamp(value):
+    try:
+        return datetime.fromisoformat(value.replace('Z', '')).replace(tzinfo=timezone.utc)
+    except (AttributeError, ValueError):
+        return None
+
+
+class ParquetSink:
+    """
+    Writes tweets with typed columns into a Parquet dataset directory. Rows are
+    buffered column-wise and written as a row group every `row_group_size` rows into
+    the open part file. A part file only becomes readable once it is closed, so it is
+    written under a hidden name and renamed into the dataset by each flush, every
+    `part_interval` seconds: that bounds the number of parts while giving durable
+    checkpoints, until which the tweets are in the journals. Resuming adds parts next
+    to the existing ones.
+    """
+    extension = ".parquet"
+    upserts = False
+
+    def __init__(self, path, append=False, row_group_size=10000, part_interval=300.0, on_flush=None):
+        if pa is None:
+            raise ImportError("output_format='parquet' requires pyarrow: pip install pyarrow")
+        self.path = path
+        self.row_group_size = row_group_size
+        self.part_interval = part_interval
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self.schema = pa.schema([
+            ("tweetId", pa.int64()),
+            ("UserScreenName", pa.string()),
+            ("UserName", pa.string()),
+            ("Timestamp", pa.timestamp("ms", tz="UTC")),
+            ("Text", pa.string()),
+            ("Embedded_text", pa.string()),
+            ("Emojis", pa.string()),
+            ("Comments", pa.int64()),
+            ("Likes", pa.int64()),
+            ("Retweets", pa.int64()),
+            ("Image link", pa.list_(pa.string())),
+            ("Tweet URL", pa.string()),
+        ])
+        if not os.path.exists(path):
+            os.makedirs(path)
+        # parts a killed run never closed are unreadable; their tweets are replayed from the journals
+        stale = glob.glob(os.path.join(glob.escape(path), ".part-*.parquet.inprogress"))
+        if not append:
+            stale += glob.glob(os.path.join(glob.escape(path), "part-*.parquet"))
+        for part in stale:
+            os.remove(part)
+        self._part = len(glob.glob(os.path.join(glob.escape(path), "part-*.parquet")))
+        self._writer = None
+        self._columns = {name: [] for name in self.schema.names}
+        self._last_flush = time.monotonic()
+
+    @property
+    def part_path(self):
+        return os.path.join(self.path, f"part-{self._part:05d}.parquet")
+
+    @property
+    def _tmp_path(self):
+        return os.path.join(self.path, f".part-{self._part:05d}.parquet.inprogress")
+
+    def write(self, tweet_id, tweet_data):
+        columns = self._columns
+        columns["tweetId"].append(_to_int(tweet_id))
+        columns["UserScreenName"].append(tweet_data.get("handle", ""))
+        columns["UserName"].append(tweet_data.get("username", ""))
+        columns["Timestamp"].append(_to_timestamp(tweet_data.get("postdate", "")))
+        columns["Text"].append(tweet_data.get("text", ""))
+        columns["Embedded_text"].append(tweet_data.get("embedded", ""))
+        columns["Emojis"].append(tweet_data.get("emojis", ""))
+        columns["Comments"].append(_to_int(tweet_data.get("reply_cnt", "0")))
+        columns["Likes"].append(_to_int(tweet_data.get("like_cnt", "0")))
+        columns["Retweets"].append(_to_int(tweet_data.get("retweet_cnt", "0")))
+        columns["Image link"].append(list(tweet_data.get("image_links", [])))
+        columns["Tweet URL"].append(tweet_data.get("tweet_url", ""))
+        if len(columns["tweetId"]) >= self.row_group_size:
+            self.write_row_group()
+        if time.monotonic() - self._last_flush >= self.part_interval:
+            self.flush()
+
+    def write_row_group(self):
+        n_rows = len(self._columns["tweetId"])
+        if not n_rows:
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._tmp_path, self.schema, compression="zstd")
+        self._writer.write_table(pa.table(self._columns, schema=self.schema), row_group_size=self.row_group_size)
+        self.rows_written += n_rows
+        self._columns = {name: [] for name in self.schema.names}
+
+    def flush(self):
+        """Close the open part and rename it into the dataset; the next rows start a new part."""
+        self.write_row_group()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            fd = os.open(self._tmp_path, os.O_RDONLY)
+            os.fsync(fd)
+            os.close(fd)
+            os.replace(self._tmp_path, self.part_path)
+            self._part += 1
+        self._last_flush = time.monotonic()
+        if self.on_flush:
+            self.on_flush()
+
+    def close(self):
+        self.flush()
+        logging.info(f"{self.rows_written} rows written to {self.path}")
+
+    @staticmethod
+    def last_timestamp(path):
+        """Max Timestamp of the dataset in '%Y-%m-%dT%H:%M:%S.000Z' format, or None."""
+        try:
+            timestamps = pq.read_table(path, columns=["Timestamp"]).column("Timestamp")
+            max_dt = pc.max(timestamps).as_py()
+        except Exception:
+            return None
+        return max_dt.strftime('%Y-%m-%dT%H:%M:%S.000Z') if max_dt else None
+
+    @staticmethod
+    def iter_ids(path):
+        """Every tweetId of the dataset, one part file at a time."""
+        for part in sorted(glob.glob(os.path.join(glob.escape(path), "part-*.parquet"))):
+            yield from pq.read_table(part, columns=["tweetId"]).column("tweetId").to_pylist()
+
+    @staticmethod
+    def iter_tweets(path):
+        """Every (tweet_id, tweet_data) of the dataset, one part file at a time."""
+        for part in sorted(glob.glob(os.path.join(glob.escape(path), "part-*.parquet"))):
+            for record in pq.read_table(part).to_pylist():
+                yield row_to_tweet([record[name] for name in CSV_HEADER])
+
+
+class SqliteSink:
+    """
+    Upserts tweets into a `tweets` table of a SQLite database keyed by tweetId, so
+    re-scraping an interval refreshes the engagement counts instead of adding
+    duplicate rows. The database is never wiped: every run merges into it. Rows are
+    buffered and written in one transaction per flush (`flush_every` rows or
+    `flush_interval` seconds).
+    """
+    extension = ".db"
+    upserts = True
+
+    def __init__(self, path, append=False, flush_every=500, flush_interval=10.0, on_flush=None):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.rows_written = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL fsyncs the WAL on every commit: journals are truncated right after
+        self._conn.execute("PRAGMA synchronous=FULL")
+        with self._conn:
+            self._conn.executescript(SQLITE_SCHEMA)
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, tweet_id, tweet_data):
+        row = tweet_to_row(tweet_id, tweet_data)
+        row[0] = _to_int(tweet_id)
+        if row[0] is None:
+            logging.info(f"Skipping tweet without a numeric id: {tweet_data.get('tweet_url', '')}")
+            return
+        for i in (7, 8, 9):  # Comments, Likes, Retweets
+            row[i] = _to_int(row[i])
+        self._buffer.append(row)
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            with self._conn:
+                self._conn.executemany(SQLITE_UPSERT, self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+        if self.on_flush:
+            self.on_flush()
+
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+            logging.info(f"{self.rows_written} rows upserted into {self.path}")
+
+    @staticmethod
+    def last_timestamp(path):
+        """Max Timestamp of the database in '%Y-%m-%dT%H:%M:%S.000Z' format, or None."""
+        try:
+            conn = sqlite3.connect(path)
+            try:
+                (max_ts,) = conn.execute("SELECT MAX(Timestamp) FROM tweets WHERE Timestamp != ''").fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        return max_ts
+
+    @staticmethod
+    def iter_tweets(path):
+        """Every (tweet_id, tweet_data) of the database, in tweetId order."""
+        conn = sqlite3.connect(path)
+        try:
+            for row in conn.execute("SELECT * FROM tweets ORDER BY tweetId"):
+                yield row_to_tweet(row)
+        finally:
+            conn.close()
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tweets (
+    tweetId INTEGER PRIMARY KEY,
+    UserScreenName TEXT,
+    UserName TEXT,
+    Timestamp TEXT,
+    Text TEXT,
+    Embedded_text TEXT,
+    Emojis TEXT,
+    Comments INTEGER,
+    Likes INTEGER,
+    Retweets INTEGER,
+    "Image link" TEXT,
+    "Tweet URL" TEXT
+);
+CREATE INDEX IF NOT EXISTS tweets_timestamp ON tweets (Timestamp);
+CREATE INDEX IF NOT EXISTS tweets_user_screen_name ON tweets (UserScreenName);
+"""
+
+# Counts change between scrapes, the rest of a tweet doesn't
+SQLITE_UPSERT = """
+INSERT INTO tweets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (tweetId) DO UPDATE SET
+    Comments = excluded.Comments,
+    Likes = excluded.Likes,
+    Retweets = excluded.Retweets
+"""
+
+
+SINKS = {
+    "csv": CsvSink,
+    "parquet": ParquetSink,
+    "sqlite": SqliteSink,
+}
@@ -0,0 +1,80 @@
+"""
+Queue of page snapshots between a tab's scroll loop and its HTML parser.
+"""
+
+import asyncio
+from collections import deque
+
+from utils import iter_tweet_articles
+
+
+class SnapshotQueue:
+    """
+    Bounded queue of page HTML snapshots with coalescing. A queued snapshot is
+    dropped as superseded once each of its tweets is either in a newer snapshot or
+    already extracted (in `seen`), since parsing it would add nothing. `put` waits
+    while `maxsize` snapshots are queued, which holds the scroll loop back when
+    parsing falls behind, so a tab keeps at most `maxsize` snapshots in memory.
+    Same get/task_done/join protocol as asyncio.Queue.
+    """
+
+    def __init__(self, maxsize=3, seen=None):
+        self.maxsize = maxsize
+        self.seen = seen if seen is not None else {}
+        self.dropped = 0
+        self._items = deque()
+        self._unfinished = 0
+        self._changed = asyncio.Condition()
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def qsize(self):
+        return len(self._items)
+
+    async def put(self, html_content, tweet_ids=None):
+        """Queue a snapshot; `tweet_ids` are its status ids if the caller already has them."""
+        if tweet_ids is None:
+            tweet_ids = [tweet_id for tweet_id, _ in iter_tweet_articles(html_content)]
+        tweet_ids = frozenset(tweet_ids)
+        async with self._changed:
+            self._coalesce(tweet_ids)
+            while len(self._items) >= self.maxsize:
+                await self._changed.wait()
+                # the parser may have extracted more tweets in the meantime
+                self._coalesce(tweet_ids)
+            self._items.append((tweet_ids, html_content))
+            self._unfinished += 1
+            self._finished.clear()
+            self._changed.notify_all()
+
+    async def get(self):
+        async with self._changed:
+            while not self._items:
+                await self._changed.wait()
+            _, html_content = self._items.popleft()
+            self._changed.notify_all()
+            return html_content
+
+    def task_done(self):
+        self._done(1)
+
+    async def join(self):
+        await self._finished.wait()
+
+    def _coalesce(self, newer_ids):
+        kept = deque()
+        for tweet_ids, html_content in self._items:
+            if all(tweet_id in newer_ids or tweet_id in self.seen for tweet_id in tweet_ids):
+                self.dropped += 1
+            else:
+                kept.append((tweet_ids, html_content))
+        superseded = len(self._items) - len(kept)
+        self._items = kept
+        if superseded:
+            self._done(superseded)
+
+    def _done(self, count):
+        self._unfinished -= count
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._finished.set()
@@ -0,0 +1,198 @@
+"""
+Scaling past one browser: a supervisor runs several Scweet processes, each with its
+own account, cookies, proxy and browser, over shards of the date ranges to scrape,
+then merges the shard outputs.
+"""
+
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+from dedup import TweetIdIndex
+from planner import split_intervals
+from sinks import SINKS, manifest_path, output_path
+
+
+def shard_ranges(since, until, n):
+    """Split [since, until] ("%Y-%m-%d" dates) into at most n contiguous whole-day ranges."""
+    since_dt = datetime.strptime(since, "%Y-%m-%d")
+    until_dt = datetime.strptime(until, "%Y-%m-%d")
+    n = max(1, min(n, (until_dt - since_dt).days))
+    return [(shard_since.strftime("%Y-%m-%d"), shard_until.strftime("%Y-%m-%d"))
+            for shard_since, shard_until in split_intervals(since_dt, until_dt, n)]
+
+
+def write_output(tweets, path, output_format="csv", resume=False):
+    """
+    Write (tweet_id, tweet_data) pairs into `path` without duplicates. With resume, the
+    rows already in `path` are written first and kept. The output is built next to
+    `path` and swapped in at the end, so an interrupted write leaves the previous one
+    intact. The sidecars of the previous output go with it: the tweet id index built
+    here replaces its own, and its interval manifest is dropped unless resume kept its
+    rows. Returns the rows written.
+    """
+    sink_class = SINKS[output_format]
+    tmp_path = f"{path}.merging"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if resume and os.path.exists(path):
+        tweets = itertools.chain(sink_class.iter_tweets(path), tweets)
+    id_index = None if sink_class.upserts else TweetIdIndex(f"{tmp_path}.ids", reset=True)
+    sink = sink_class(tmp_path)
+    count = 0
+    try:
+        for tweet_id, tweet_data in tweets:
+            if id_index is not None:
+                if tweet_id in id_index:
+                    continue
+                id_index.add(tweet_id)
+            sink.write(tweet_id, tweet_data)
+            count += 1
+    except BaseException:
+        if id_index is not None:
+            id_index.close()
+            id_index.remove()
+        raise
+    finally:
+        sink.close()
+    if id_index is not None:
+        id_index.commit()
+        id_index.compact()
+        id_index.close()
+
+    # a missing id index is rebuilt from the output, so the stale one goes first
+    stale = [f"{path}.ids", f"{path}.ids.log", f"{path}.ids.bloom"]
+    if not resume:
+        stale.append(f"{path}.intervals.json")
+    for sidecar in stale:
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    if os.path.exists(manifest_path(tmp_path)):
+        os.replace(manifest_path(tmp_path), manifest_path(path))
+    if id_index is not None:
+        os.replace(id_index.path, f"{path}.ids")
+        os.replace(id_index.bloom_path, f"{path}.ids.bloom")
+    return count
+
+
+def merge_outputs(shard_paths, path, output_format="csv", resume=False):
+    """
+    Merge the shard outputs into `path`, in shard order, after the rows already in
+    `path` with resume (see write_output). Returns the rows written.
+    """
+    sink_class = SINKS[output_format]
+
+    def shard_tweets():
+        for shard_path in shard_paths:
+            if not os.path.exists(shard_path):
+                logging.info(f"Shard {shard_path} was not written, skipping it")
+                continue
+            yield from sink_class.iter_tweets(shard_path)
+
+    count = write_output(shard_tweets(), path, output_format, resume=resume)
+    logging.info(f"Merged {count} rows from {len(shard_paths)} shards into {path}")
+    return count
+
+
+def _run_worker(scweet_kwargs, jobs, start_delay):
+    """Process entry point: one browser and one login scraping its shards as a batch."""
+    # imported here so the supervisor itself doesn't need the browser dependencies loaded
+    from scweet import Scweet
+
+    time.sleep(start_delay)
+    scweet = Scweet(**scweet_kwargs)
+    return list(scweet.batch_scrape(jobs))
+
+
+class ScrapeSupervisor:
+    """
+    Runs one browser process per entry of `workers`. Each entry holds the Scweet
+    arguments specific to that process, e.g. its own `env_path` (account),
+    `cookies_path` and `proxy`; `scweet_kwargs` are shared by all of them. The date
+    range of every job is cut into `shards_per_worker` shards per process, dealt out
+    round-robin, and each process scrapes its shards in one session (see
+    Scweet.abatch_scrape), `start_delay` seconds after the previous one so logins
+    don't all hit X at once. Shards write to <save_dir>/.shards/ and are merged into
+    the job's own output once every process has finished. Shards keep their interval
+    manifests, so with resume=True a rerun only scrapes what is missing and merges again,
+    on top of the rows already in the job's output.
+    """
+
+    def __init__(self, workers, shards_per_worker=1, start_delay=10, **scweet_kwargs):
+        if not workers:
+            raise ValueError("At least one worker is required")
+        self.workers = list(workers)
+        self.shards_per_worker = shards_per_worker
+        self.start_delay = start_delay
+        self.scweet_kwargs = scweet_kwargs
+
+    def scrape(self, **scrape_kwargs):
+        """Shard, scrape and merge one ascrape call. Returns the merged output path."""
+        return self.batch_scrape([scrape_kwargs])[0]
+
+    def batch_scrape(self, jobs):
+        """Shard, scrape and merge each job (ascrape arguments). Returns the merged output paths."""
+        n_shards = len(self.workers) * self.shards_per_worker
+        worker_jobs = [[] for _ in self.workers]
+        merges = []
+        position = 0
+        for job in jobs:
+            job = dict(job)
+            # results are read back from the merged output
+            job.pop("keep_results", None)
+            until = job.get("until") or date.today().strftime("%Y-%m-%d")
+            words = job.get("words")
+            if words and isinstance(words, str):
+                words = words.split("//")
+            output_format = job.get("output_format", "csv")
+            path = output_path(job.get("save_dir", "outputs"), job["since"], until, words=words,
+                               from_account=job.get("from_account"), to_account=job.get("to_account"),
+                               mention_account=job.get("mention_account"), hashtag=job.get("hashtag"),
+                               custom_csv_name=job.get("custom_csv_name"), output_format=output_format)
+            shard_dir = os.path.join(os.path.dirname(path) or ".", ".shards")
+            stem = os.path.splitext(os.path.basename(path))[0]
+            ranges = shard_ranges(job["since"], until, n_shards)
+            limit = job.get("limit", float("inf"))
+            shard_paths = []
+            for i, (shard_since, shard_until) in enumerate(ranges):
+                if not math.isinf(limit):
+                    # the shard limits add up to the job's limit
+                    shard_limit = int(limit) // len(ranges) + (i < int(limit) % len(ranges))
+                else:
+                    shard_limit = limit
+                shard = dict(job, since=shard_since, until=shard_until, save_dir=shard_dir,
+                             custom_csv_name=f"{stem}.part{i}.csv", keep_results=False, limit=shard_limit)
+                shard_paths.append(output_path(shard_dir, shard_since, shard_until,
+                                               custom_csv_name=shard["custom_csv_name"],
+                                               output_format=output_format))
+                worker_jobs[position % len(self.workers)].append(shard)
+                position += 1
+            merges.append((shard_paths, path, output_format, job.get("resume", False)))
+
+        # each shard gets its share of the intervals one process would have used
+        n_splits = self.scweet_kwargs.get("n_splits", 5)
+        shared_kwargs = dict(self.scweet_kwargs, n_splits=max(1, math.ceil(n_splits / n_shards)))
+        spawn = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(self.workers), mp_context=spawn) as executor:
+            futures = [
+                executor.submit(_run_worker, dict(shared_kwargs, **worker), shards, i * self.start_delay)
+                for i, (worker, shards) in enumerate(zip(self.workers, worker_jobs)) if shards
+            ]
+            for future in futures:
+                try:
+                    logging.info(f"Worker done: {', '.join(future.result())}")
+                except Exception as e:
+                    # its shards stay incomplete until the next resumed run
+                    logging.info(f"Worker failed: {e}")
+
+        for shard_paths, path, output_format, resume in merges:
+            merge_outputs(shard_paths, path, output_format, resume=resume)
+        return [path for _, path, _, _ in merges]
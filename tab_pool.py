@@ -0,0 +1,99 @@
+"""
+Pool of pre-warmed browser tabs shared by the tweet and profile fetchers.
+"""
+
+import asyncio
+import json
+import logging
+
+from page_scripts import NAVIGATE_JS, HEAP_SIZE_JS
+
+
+class TabPool:
+    """
+    Keeps up to `size` tabs with the X shell already loaded. Tabs move between
+    urls with in-app navigation and are recycled after `max_uses` acquisitions
+    or once their JS heap grows over `max_heap_mb`.
+    """
+
+    def __init__(self, driver, size, max_uses=25, max_heap_mb=512, home_url="https://x.com/home"):
+        self.driver = driver
+        self.size = size
+        self.max_uses = max_uses
+        self.max_heap_mb = max_heap_mb
+        self.home_url = home_url
+        self._idle = []
+        self._uses = {}
+        self._semaphore = asyncio.Semaphore(size)
+        self.stats = {
+            "created": 0,
+            "reused": 0,
+            "recycled": 0,
+            "discarded": 0,
+            "in_app_navigations": 0,
+            "full_navigations": 0,
+        }
+
+    async def acquire(self):
+        await self._semaphore.acquire()
+        try:
+            if self._idle:
+                tab = self._idle.pop()
+                self.stats["reused"] += 1
+            else:
+                tab = await self.driver.get(self.home_url, new_tab=True)
+                await tab.sleep(2)
+                self._uses[tab.target_id] = 0
+                self.stats["created"] += 1
+        except Exception:
+            self._semaphore.release()
+            raise
+        self._uses[tab.target_id] += 1
+        return tab
+
+    async def navigate(self, tab, url):
+        """Route the tab to url inside the loaded app, falling back to a full page load."""
+        try:
+            mode = await tab.evaluate(NAVIGATE_JS % json.dumps(url))
+        except Exception:
+            mode = "full"
+        if mode == "in_app":
+            self.stats["in_app_navigations"] += 1
+            await tab.sleep(1)
+        else:
+            self.stats["full_navigations"] += 1
+            await tab.get(url)
+        return tab
+
+    async def release(self, tab, discard=False):
+        try:
+            uses = self._uses.get(tab.target_id, 0)
+            if discard:
+                self.stats["discarded"] += 1
+                await self._close_tab(tab)
+            elif uses >= self.max_uses or await self._heap_mb(tab) >= self.max_heap_mb:
+                self.stats["recycled"] += 1
+                await self._close_tab(tab)
+            else:
+                self._idle.append(tab)
+        finally:
+            self._semaphore.release()
+
+    async def close(self):
+        for tab in self._idle:
+            await self._close_tab(tab)
+        self._idle = []
+        logging.info(f"Tab pool stats: {self.stats}")
+
+    async def _heap_mb(self, tab):
+        try:
+            return int(await tab.evaluate(HEAP_SIZE_JS)) / (1024 * 1024)
+        except Exception:
+            return 0
+
+    async def _close_tab(self, tab):
+        self._uses.pop(tab.target_id, None)
+        try:
+            await tab.close()
+        except Exception as e:
+            logging.info(f"Couldn't close tab: {e}")
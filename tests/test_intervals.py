@@ -0,0 +1,89 @@
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from manifest import IntervalManifest
+from planner import IntervalPlanner, split_intervals
+from utils import TWITTER_EPOCH_MS, interval_query
+
+
+def query_bounds(since_part, until_part):
+    """Decode the [since, until) datetimes searched by interval_query's operators."""
+    def decode(part, operator):
+        value = re.search(operator + r"%3A([\d-]+)%20", part).group(1)
+        if operator in ("since", "until"):
+            return datetime.strptime(value, "%Y-%m-%d")
+        # since_id is exclusive and max_id inclusive: both sit one below the bound's first id
+        ms = ((int(value) + 1) >> 22) + TWITTER_EPOCH_MS
+        return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+    since = decode(since_part, "since_id" if "since_id" in since_part else "since")
+    until = decode(until_part, "max_id" if "max_id" in until_part else "until")
+    return since, until
+
+
+def assert_covers(intervals, since, until):
+    bounds = [query_bounds(*interval_query(*interval)) for interval in intervals]
+    assert bounds == intervals
+    assert bounds[0][0] == since
+    assert bounds[-1][1] == until
+    for (_, previous_until), (next_since, _) in zip(bounds, bounds[1:]):
+        assert previous_until == next_since
+
+
+@pytest.mark.parametrize("since, until, n", [
+    (datetime(2024, 1, 1), datetime(2024, 1, 4), 5),
+    (datetime(2024, 1, 1), datetime(2024, 1, 31), 7),
+    (datetime(2024, 1, 1), datetime(2024, 1, 31), -1),
+    (datetime(2024, 1, 1, 12), datetime(2024, 1, 5), 1),
+    (datetime(2024, 1, 1, 12), datetime(2024, 1, 5), 3),
+    (datetime(2024, 1, 1, 9, 30), datetime(2024, 1, 2, 17, 15), 7),
+    (datetime(2024, 1, 1), datetime(2024, 1, 1), 2),
+])
+def test_split_intervals_cover_the_range(since, until, n):
+    if until <= since:
+        until = since + timedelta(days=1)
+    assert_covers(split_intervals(since, until, n), since, until)
+
+
+def test_merged_intervals_cover_the_range(tmp_path):
+    since, until = datetime(2024, 1, 1), datetime(2024, 1, 4)
+    intervals = split_intervals(since, until, 5)
+    manifest = IntervalManifest(str(tmp_path / "out.csv.intervals.json"))
+    planner = IntervalPlanner(intervals, lambda *interval: "%s..%s" % interval, manifest, adaptive=True)
+
+    async def drain():
+        scraped = []
+        while True:
+            task = await planner.get()
+            if task is None:
+                return scraped
+            _, _, interval = task
+            scraped.append(interval)
+            # sparse intervals let the next ones be merged
+            await planner.done(interval, {"reason": "end", "tweets": 1})
+
+    scraped = asyncio.run(drain())
+    assert planner.merges
+    assert len(scraped) < len(intervals)
+    assert_covers(sorted(scraped), since, until)
+
+
+def test_stopped_planner_queues_nothing(tmp_path):
+    intervals = split_intervals(datetime(2024, 1, 1), datetime(2024, 1, 5), 2)
+    manifest = IntervalManifest(str(tmp_path / "out.csv.intervals.json"))
+    planner = IntervalPlanner(intervals, lambda *interval: "%s..%s" % interval, manifest, adaptive=True)
+
+    async def run():
+        _, _, interval = await planner.get()
+        planner.stop()
+        # a saturated interval finishing after the limit was reached isn't split
+        status = {"reason": "limit", "tweets": 2500}
+        await planner.done(interval, status)
+        return status, await planner.get()
+
+    status, task = asyncio.run(run())
+    assert task is None and status["reason"] == "limit"
+    assert not planner.pending and not planner.splits
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+from parsers import extract_tweet, get_parser_backend, parse_tweets
+from utils import iter_tweet_articles
+
+pytest.importorskip("lxml")
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="module")
+def timeline():
+    return read_fixture("timeline.html")
+
+
+def test_backends_agree_on_articles(timeline):
+    articles = [article_html for _, article_html in iter_tweet_articles(timeline)]
+    assert len(articles) == 4
+    for article_html in articles:
+        assert get_parser_backend("bs4").parse_tweet(article_html) == get_parser_backend("lxml").parse_tweet(article_html)
+
+
+def test_backends_agree_on_timeline(timeline):
+    records = parse_tweets(timeline, (), "bs4")
+    assert records == parse_tweets(timeline, (), "lxml")
+    # the promoted article is dropped, the one without a status link is kept under ""
+    assert [tweet_id for tweet_id, _ in records] == ["1780000000000000001", "1780000000000000002", ""]
+    tweet = records[0][1]
+    assert tweet["username"] == "MetroFan"
+    assert tweet["handle"] == "@metro_fan"
+    assert tweet["emojis"] == "😡"
+    assert len(tweet["image_links"]) == 2
+
+
+def test_seen_ids_are_skipped(timeline):
+    for backend in ("bs4", "lxml"):
+        records = parse_tweets(timeline, {"1780000000000000001"}, backend)
+        assert [tweet_id for tweet_id, _ in records] == ["1780000000000000002", ""]
+
+
+def test_article_parsed_alone_matches_document(timeline):
+    posts = BeautifulSoup(timeline, "html.parser").select("article[data-testid=tweet]")
+    in_document = [extract_tweet(post) for post in posts]
+    alone = [get_parser_backend("bs4").parse_tweet(article_html) for _, article_html in iter_tweet_articles(timeline)]
+    assert in_document == alone
+
+
+def test_backends_agree_on_profile():
+    html_content = read_fixture("profile.html")
+    profile = get_parser_backend("bs4").parse_profile(html_content)
+    assert profile == get_parser_backend("lxml").parse_profile(html_content)
+    assert profile["following"] == 1234
+    assert profile["verified_followers"] == 5600
+    assert profile["website"] == "https://t.co/abc123"
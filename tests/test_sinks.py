@@ -0,0 +1,83 @@
+import csv
+import json
+import os
+
+import pytest
+
+from sinks import CSV_HEADER, CsvSink, manifest_path, read_csv_stats
+
+
+def write_csv(path, n_rows, torn=False):
+    """A CSV as CsvSink writes it, without a manifest; `torn` cuts a last row short like a killed run."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for i in range(n_rows):
+            # multi-line texts starting with digits look like row starts
+            writer.writerow([str(1000 + i), "@h", "u", f"2024-01-{1 + i % 28:02d}T00:00:00.000Z",
+                             f"text\n{i}, more", "", "", "0", "0", "0", "", f"/h/status/{1000 + i}"])
+        if torn:
+            f.write('99999,@h,u,2024-02-01T00:00:00.000Z,"torn\n12,')
+    return path
+
+
+@pytest.mark.parametrize("torn", [False, True])
+def test_tail_scan_finds_max_timestamp(tmp_path, torn):
+    path = write_csv(str(tmp_path / "out.csv"), 3000, torn=torn)
+    stats = read_csv_stats(path)
+    assert stats["max_timestamp"] == "2024-01-28T00:00:00.000Z"
+    assert stats["rows"] is None and stats["min_timestamp"] is None
+
+
+def test_torn_rows_after_manifest(tmp_path):
+    path = str(tmp_path / "out.csv")
+    sink = CsvSink(path)
+    sink.write("1", {"postdate": "2024-01-05T00:00:00.000Z"})
+    sink.close()
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(["2", "@h", "u", "2024-01-09T00:00:00.000Z"] + [""] * 8)
+        f.write('3,@h,u,2024-01-10T00:00:00.000Z,"torn')
+    stats = read_csv_stats(path)
+    assert (stats["rows"], stats["min_timestamp"], stats["max_timestamp"]) == \
+        (2, "2024-01-05T00:00:00.000Z", "2024-01-09T00:00:00.000Z")
+
+
+def test_append_keeps_unknown_min_unknown(tmp_path):
+    path = write_csv(str(tmp_path / "out.csv"), 10)
+    sink = CsvSink(path, append=True)
+    sink.write("5", {"postdate": "2025-01-01T00:00:00.000Z"})
+    sink.close()
+    with open(manifest_path(path), encoding="utf-8") as f:
+        stats = json.load(f)
+    assert stats["min_timestamp"] is None and stats["rows"] is None
+    assert stats["max_timestamp"] == "2025-01-01T00:00:00.000Z"
+
+
+def test_overwrite_drops_previous_manifest(tmp_path):
+    path = str(tmp_path / "out.csv")
+    sink = CsvSink(path)
+    sink.write("1", {"postdate": "2024-01-05T00:00:00.000Z"})
+    sink.close()
+    sink = CsvSink(path)
+    try:
+        assert not os.path.exists(manifest_path(path))
+    finally:
+        sink.close()
+
+
+def test_parquet_flush_publishes_part(tmp_path):
+    pytest.importorskip("pyarrow")
+    from sinks import ParquetSink
+
+    path = str(tmp_path / "out.parquet")
+    flushed = []
+    sink = ParquetSink(path, row_group_size=2, on_flush=lambda: flushed.append(sorted(ParquetSink.iter_ids(path))))
+    for tweet_id in range(3):
+        sink.write(str(tweet_id), {"postdate": "2024-01-01T00:00:00.000Z"})
+    # row groups go to the open part, which isn't part of the dataset yet
+    assert list(ParquetSink.iter_ids(path)) == []
+    sink.flush()
+    sink.write("3", {})
+    sink.close()
+    assert flushed == [[0, 1, 2], [0, 1, 2, 3]]
+    assert sorted(os.listdir(path)) == ["part-00000.parquet", "part-00001.parquet"]
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from dedup import TweetIdIndex
+from sinks import SINKS
+from supervisor import merge_outputs, write_output
+
+
+def tweets(ids):
+    return [(str(tweet_id), {"handle": "@h", "postdate": "2024-01-01T00:00:00.000Z",
+                             "tweet_url": f"/h/status/{tweet_id}"}) for tweet_id in ids]
+
+
+@pytest.fixture
+def previous_output(tmp_path):
+    """An output with the sidecars a single-process run leaves next to it."""
+    path = str(tmp_path / "out.csv")
+    write_output(tweets([1, 2]), path)
+    with open(f"{path}.intervals.json", "w") as f:
+        f.write("{}")
+    return path
+
+
+def write_shards(tmp_path, shards):
+    paths = []
+    for i, ids in enumerate(shards):
+        paths.append(str(tmp_path / f"out.part{i}.csv"))
+        write_output(tweets(ids), paths[-1])
+    return paths
+
+
+@pytest.mark.parametrize("resume, expected", [(True, ["1", "2", "3", "4"]), (False, ["2", "3", "4"])])
+def test_merge_replaces_output_and_sidecars(tmp_path, previous_output, resume, expected):
+    shard_paths = write_shards(tmp_path, [[2, 3], [4, 3]])
+    merge_outputs(shard_paths, previous_output, resume=resume)
+
+    assert [tweet_id for tweet_id, _ in SINKS["csv"].iter_tweets(previous_output)] == expected
+    index = TweetIdIndex(f"{previous_output}.ids")
+    try:
+        assert len(index) == len(expected)
+        assert all(tweet_id in index for tweet_id in expected)
+    finally:
+        index.close()
+    # the interval manifest only still describes the output when its rows were kept
+    assert os.path.exists(f"{previous_output}.intervals.json") == resume
+    assert not [name for name in os.listdir(tmp_path) if ".merging" in name]
@@ -0,0 +1,199 @@
+"""
+Capture of the timeline API responses (SearchTimeline GraphQL) a tab fetches
+while it scrolls, decoded into the same tweet dicts as parsers.extract_tweet.
+"""
+
+import asyncio
+import base64
+import html
+import json
+import logging
+import re
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+import nodriver as uc
+
+TIMELINE_OPERATIONS = ("/SearchTimeline",)
+
+EMOJI_RE = re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF]")
+
+
+def find_result(payload, key="instructions"):
+    """Depth-first search for the first value stored under `key` in a GraphQL payload."""
+    if isinstance(payload, dict):
+        if key in payload:
+            return payload[key]
+        values = payload.values()
+    elif isinstance(payload, list):
+        values = payload
+    else:
+        return None
+    for value in values:
+        found = find_result(value, key)
+        if found is not None:
+            return found
+    return None
+
+
+def tweet_from_result(result):
+    """Map a GraphQL tweet result to (tweet_id, tweet) or None for tombstones and unavailable tweets."""
+    if not result:
+        return None
+    if result.get("__typename") == "TweetWithVisibilityResults":
+        result = result.get("tweet", {})
+    legacy = result.get("legacy")
+    if not legacy:
+        return None
+
+    user = result.get("core", {}).get("user_results", {}).get("result", {})
+    screen_name = user.get("core", {}).get("screen_name") or user.get("legacy", {}).get("screen_name", "")
+    name = user.get("core", {}).get("name") or user.get("legacy", {}).get("name", "")
+    tweet_id = result.get("rest_id") or legacy.get("id_str", "")
+
+    note = result.get("note_tweet", {}).get("note_tweet_results", {}).get("result", {})
+    text = html.unescape(note.get("text") or legacy.get("full_text", ""))
+
+    quoted = result.get("quoted_status_result", {}).get("result")
+    if quoted and quoted.get("__typename") == "TweetWithVisibilityResults":
+        quoted = quoted.get("tweet", {})
+    embedded = html.unescape(quoted.get("legacy", {}).get("full_text", "")) if quoted else ""
+
+    try:
+        postdate = datetime.strptime(legacy["created_at"], "%a %b %d %H:%M:%S %z %Y")
+        postdate = postdate.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    except (KeyError, ValueError):
+        postdate = ""
+
+    media = legacy.get("extended_entities", legacy.get("entities", {})).get("media", [])
+    tweet = {
+        "username": name,
+        "handle": f"@{screen_name}" if screen_name else "",
+        "postdate": postdate,
+        "text": text,
+        "embedded": embedded,
+        "emojis": " ".join(EMOJI_RE.findall(text)),
+        "reply_cnt": str(legacy.get("reply_count", 0)),
+        "retweet_cnt": str(legacy.get("retweet_count", 0)),
+        "like_cnt": str(legacy.get("favorite_count", 0)),
+        "image_links": [m["media_url_https"] for m in media if m.get("media_url_https")],
+        "tweet_url": f"/{screen_name}/status/{tweet_id}",
+    }
+    return tweet_id, tweet
+
+
+def request_cursor(url):
+    """The cursor a timeline request was sent with (None for the first page)."""
+    try:
+        variables = parse_qs(urlparse(url).query).get("variables")
+        return json.loads(variables[0]).get("cursor") if variables else None
+    except (ValueError, AttributeError):
+        return None
+
+
+def parse_timeline_response(payload):
+    """
+    Decode one timeline response. Returns (records, bottom_cursor, tweet_entries) where
+    records are (tweet_id, tweet) pairs and tweet_entries counts the tweet entries of the
+    page; promoted entries are skipped like in the DOM extraction.
+    """
+    entries = []
+    for instruction in find_result(payload) or []:
+        if instruction.get("type") == "TimelineAddEntries":
+            entries.extend(instruction.get("entries", []))
+        elif instruction.get("type") == "TimelineReplaceEntry":
+            entries.append(instruction.get("entry", {}))
+
+    records = []
+    bottom_cursor = None
+    tweet_entries = 0
+    for entry in entries:
+        content = entry.get("content", {})
+        if content.get("cursorType") == "Bottom":
+            bottom_cursor = content.get("value")
+            continue
+        if "itemContent" in content:
+            items = [content["itemContent"]]
+        else:
+            items = [item.get("item", {}).get("itemContent", {}) for item in content.get("items", [])]
+        for item in items:
+            if item.get("itemType") != "TimelineTweet":
+                continue
+            tweet_entries += 1
+            if "promotedMetadata" in item:
+                continue
+            record = tweet_from_result(item.get("tweet_results", {}).get("result"))
+            if record:
+                records.append(record)
+    return records, bottom_cursor, tweet_entries
+
+
+class TimelineCapture:
+    """
+    Listens to the Network events of one tab and decodes the timeline responses it
+    receives. Handlers must be attached before the tab navigates to the search.
+    """
+
+    def __init__(self, tab, operations=TIMELINE_OPERATIONS):
+        self.tab = tab
+        self.operations = operations
+        self.responses = 0
+        self.cursor = None
+        # set once a page fetched with a bottom cursor has no tweets, or returns the
+        # same bottom cursor: scrolling further won't load more
+        self.exhausted = False
+        self._bottom_cursors = set()
+        self._requests = {}
+        self._records = []
+        self._tasks = set()
+
+    async def start(self):
+        self.tab.add_handler(uc.cdp.network.ResponseReceived, self.on_response_received)
+        self.tab.add_handler(uc.cdp.network.LoadingFinished, self.on_loading_finished)
+        await self.tab.send(uc.cdp.network.enable())
+
+    async def stop(self):
+        await self.settle()
+        for event_type, handler in ((uc.cdp.network.ResponseReceived, self.on_response_received),
+                                    (uc.cdp.network.LoadingFinished, self.on_loading_finished)):
+            if handler in self.tab.handlers.get(event_type, []):
+                self.tab.handlers[event_type].remove(handler)
+
+    async def settle(self):
+        """Wait for the response bodies that are still being fetched."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def drain(self):
+        records, self._records = self._records, []
+        return records
+
+    async def on_response_received(self, event: uc.cdp.network.ResponseReceived):
+        if any(operation in event.response.url for operation in self.operations):
+            self._requests[event.request_id] = request_cursor(event.response.url)
+
+    async def on_loading_finished(self, event: uc.cdp.network.LoadingFinished):
+        if event.request_id in self._requests:
+            cursor = self._requests.pop(event.request_id)
+            # the event listener awaits handlers, so the body is fetched in a task
+            task = asyncio.create_task(self.read_response(event.request_id, cursor))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def read_response(self, request_id, cursor=None):
+        try:
+            body, base64_encoded = await self.tab.send(uc.cdp.network.get_response_body(request_id))
+            if base64_encoded:
+                body = base64.b64decode(body).decode("utf-8")
+            records, bottom_cursor, tweet_entries = parse_timeline_response(json.loads(body))
+        except Exception as e:
+            logging.info(f"Couldn't decode timeline response: {e}")
+            return
+        self.responses += 1
+        self._records.extend(records)
+        # first pages and top cursor (new tweets) polls may be empty without the timeline ending
+        if cursor in self._bottom_cursors and (not tweet_entries or bottom_cursor == cursor):
+            self.exhausted = True
+        if bottom_cursor:
+            self._bottom_cursors.add(bottom_cursor)
+            self.cursor = bottom_cursor
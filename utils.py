@@ -6,10 +6,16 @@ Repository: https://github.com/Altimis/scweet
 """
 
 import re
+import html
+import json
+import logging
 import random
 import string
 from mailtm import *
 import urllib
+from datetime import datetime, timezone
+
+from page_scripts import PAGE_STATE_JS, EXTRACT_TWEETS_JS, RESET_EXTRACTOR_JS
 
 
 async def check_element_if_exists_by_text(tab, text, timeout=10):
@@ -28,6 +34,37 @@ async def check_element_if_exists_by_css(tab, css, timeout=20):
         return False
 
 
+async def get_page_state(tab):
+    """
+    Classify the current page in a single quick evaluation instead of waiting on
+    text lookups. Returns 'ok', 'rate_limited', 'retry', 'suspended' or 'end'.
+    """
+    try:
+        state = await tab.evaluate(PAGE_STATE_JS)
+        return state if isinstance(state, str) else "ok"
+    except:
+        return "ok"
+
+
+async def extract_tweets_in_page(tab):
+    """
+    Run the tweet extractor inside the page and return the (tweet_id, tweet) pairs it
+    has not reported before. Only these compact records cross CDP, not the page HTML.
+    """
+    try:
+        return [tuple(record) for record in json.loads(await tab.evaluate(EXTRACT_TWEETS_JS))]
+    except Exception as e:
+        logging.info(f"In-page extraction failed: {e}")
+        return []
+
+
+async def reset_page_extractor(tab):
+    try:
+        await tab.evaluate(RESET_EXTRACTOR_JS)
+    except:
+        pass
+
+
 async def get_code_from_email(email_address, email_password):
     try:
         retries = 0
@@ -69,7 +106,7 @@ async def get_code_from_email(email_address, email_password):
 
 
 def extract_count_from_aria_label(element):
-    if not element:
+    if element is None:
         return "0"
     aria_label = element.get('aria-label', '')
     match = re.search(r'(\d+)', aria_label)
@@ -78,6 +115,46 @@ def extract_count_from_aria_label(element):
     return "0"
 
 
+TWEET_ARTICLE_RE = re.compile(r'<article\b[^>]*data-testid="tweet"[^>]*>.*?</article>', re.S)
+STATUS_HREF_RE = re.compile(r'<a\b[^>]*?\bhref="([^"]*/status/[^"]*)"')
+
+
+def iter_tweet_articles(html_content):
+    """
+    Cheap prefilter over raw page HTML. Yields (status_id, article_html) for every
+    article[data-testid=tweet] without building a DOM; status_id is the last path
+    segment of the first /status/ link, same as get_data's tweet_url, or None.
+    """
+    for match in TWEET_ARTICLE_RE.finditer(html_content):
+        article_html = match.group(0)
+        href = STATUS_HREF_RE.search(article_html)
+        tweet_id = html.unescape(href.group(1)).split("/")[-1] if href else None
+        yield tweet_id, article_html
+
+
+# Snowflake tweet ids hold their creation time, in ms since this epoch, above bit 22
+TWITTER_EPOCH_MS = 1288834974657
+
+
+def snowflake_from_datetime(dt):
+    """Smallest tweet id created at `dt`; naive datetimes are taken as UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return max(round(dt.timestamp() * 1000) - TWITTER_EPOCH_MS, 0) << 22
+
+
+def interval_query(since, until):
+    """
+    (since part, until part) of a search query bounding it to [since, until): the
+    since:/until: operators between whole days, snowflake id bounds otherwise.
+    """
+    if since.time() == until.time() == datetime.min.time():
+        return f"since%3A{since.strftime('%Y-%m-%d')}%20", f"until%3A{until.strftime('%Y-%m-%d')}%20"
+    # sub-day bounds: since_id is exclusive and max_id inclusive
+    return (f"since_id%3A{snowflake_from_datetime(since) - 1}%20",
+            f"max_id%3A{snowflake_from_datetime(until) - 1}%20")
+
+
 def dowload_images(urls, save_dir):
     for i, url_v in enumerate(urls):
         for j, url in enumerate(url_v):